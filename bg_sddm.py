@@ -1,10 +1,8 @@
 #!/usr/bin/env python3
 
-import gi
-gi.require_version('Gtk', '3.0')
-gi.require_version('Gdk', '3.0')
+import time
+STARTUP_TIME = time.perf_counter()
 
-from gi.repository import Gtk, GLib, Gio, Gdk, GdkPixbuf, Pango
 import os
 import shutil
 import subprocess
@@ -14,34 +12,268 @@ import tempfile
 
 # For additional functionalities
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import urllib.parse
-from PIL import Image, ImageStat
-import colorsys
-import numpy as np
-from sklearn.cluster import KMeans
-import webcolors
-
-class SDDMBackgroundChanger(Gtk.Application):
-    def __init__(self):
-        super().__init__(application_id='com.rhythmcreative.bg-sddm')
-        self.theme_path = '/usr/share/sddm/themes/sddm-astronaut-theme'
-        self.backgrounds_path = f'{self.theme_path}/Backgrounds'
-        self.config_path = f'{self.theme_path}/Themes/theme1.conf'
-        self.current_theme_colors = {
-            'primary': '#1a1a1a',
-            'secondary': '#2d2d2d', 
-            'accent': '#4CAF50',
-            'text': '#e0e0e0'
-        }
-        self.css_provider = None
-        self.setup_css()
+import hashlib
+import threading
+import multiprocessing
+import atexit
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+# numpy, PIL y scikit-learn se importan solo al extraer una paleta (ver load_palette_modules)
+HEAVY_MODULES = ('numpy', 'PIL', 'sklearn')
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+IMPORT_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tiff')
+
+# Normalización opcional al importar (ver normalize_image)
+NORMALIZED_EXTENSIONS = {'jpeg': '.jpg', 'webp': '.webp'}
+ORIGINALS_DIR = 'Originals'
+# Duplicados al importar: omitirlos, importarlos avisando o importarlos sin comprobar
+DUPLICATE_POLICIES = ('skip', 'flag', 'allow')
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'bg-sddm')
+# Miniaturas compartidas con el escritorio (especificación de freedesktop.org)
+SHARED_THUMBNAILS_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'thumbnails')
+SETTINGS_FILE = os.path.expanduser('~/.config/bg-sddm/settings.json')
+SDDM_THEMES_DIR = '/usr/share/sddm/themes'
+DEFAULT_THEME_PATH = f'{SDDM_THEMES_DIR}/sddm-astronaut-theme'
+# Ayudante instalado por install.sh; pkexec solo lo ejecuta a él (org.bg-sddm.helper.policy)
+PRIVILEGED_HELPER = '/usr/lib/bg-sddm/bg-sddm-helper'
+
+class TraceSpan:
+    """One timed region; recorded into its Tracer when the with-block exits"""
+    
+    __slots__ = ('tracer', 'name', 'args', 'start')
+    
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
         
-    def extract_colors_from_image(self, image_path):
-        """Extract dominant colors from an image"""
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+class Tracer:
+    """Hot-path timing spans, recorded only when enabled (BG_SDDM_TRACE or --trace)
+    
+    BG_SDDM_TRACE=1 prints a per-span summary at exit; any other value is also
+    the path of a Chrome trace file (chrome://tracing or ui.perfetto.dev).
+    When disabled, span() returns a shared no-op context manager.
+    """
+    
+    NULL_SPAN = contextlib.nullcontext()
+    
+    def __init__(self, setting=None):
+        self.enabled = False
+        self.output = None
+        self.events = []
+        self.last = {}
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        if setting and setting != '0':
+            self.enable(None if setting == '1' else setting)
+            
+    def enable(self, output=None):
+        """Start recording; the report is written when the process exits"""
+        if not self.enabled:
+            atexit.register(self.report)
+        self.enabled = True
+        self.output = output or self.output
+        
+    def span(self, name, **args):
+        if not self.enabled:
+            return self.NULL_SPAN
+        return TraceSpan(self, name, args)
+        
+    def record(self, name, start, end, args):
+        with self.lock:
+            self.events.append((name, start, end - start, threading.get_ident(), args))
+            self.last[name] = end - start
+            
+    def last_ms(self, name):
+        """Duration of the most recent span with this name, in milliseconds (or None)"""
+        duration = self.last.get(name)
+        return None if duration is None else duration * 1000
+        
+    def summary(self):
+        """{name: (count, total seconds, max seconds)}"""
+        totals = {}
+        with self.lock:
+            for name, _, duration, _, _ in self.events:
+                count, total, longest = totals.get(name, (0, 0.0, 0.0))
+                totals[name] = (count + 1, total + duration, max(longest, duration))
+        return totals
+        
+    def write_chrome_trace(self, path):
+        """Export the spans in the Chrome trace event format"""
+        pid = os.getpid()
+        with self.lock:
+            events = [
+                {'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                 'ts': round((start - self.origin) * 1e6, 1), 'dur': round(duration * 1e6, 1),
+                 'args': {key: str(value) for key, value in args.items()}}
+                for name, start, duration, tid, args in self.events
+            ]
+        atomic_write(path, json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}))
+        
+    def report(self):
+        """Print the summary to stderr and write the Chrome trace if requested"""
+        # Los procesos del pool de paletas heredan la variable pero no informan
+        if multiprocessing.parent_process() is not None or not self.events:
+            return
+            
+        print(f"{'span':<24}{'count':>8}{'total ms':>12}{'mean ms':>10}{'max ms':>10}", file=sys.stderr)
+        for name, (count, total, longest) in sorted(self.summary().items(), key=lambda item: -item[1][1]):
+            print(f"{name:<24}{count:>8}{total * 1000:>12.1f}{total * 1000 / count:>10.2f}{longest * 1000:>10.2f}",
+                  file=sys.stderr)
+        if self.output:
+            try:
+                self.write_chrome_trace(self.output)
+                print(f"Trace written to {self.output}", file=sys.stderr)
+            except OSError as e:
+                print(f"Error writing trace: {e}", file=sys.stderr)
+
+TRACER = Tracer(os.environ.get('BG_SDDM_TRACE'))
+
+def list_background_images(backgrounds_path):
+    """Sorted list of image filenames in a backgrounds directory"""
+    return sorted(name for name in os.listdir(backgrounds_path) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+def collect_image_files(paths, extensions=IMPORT_EXTENSIONS):
+    """Expand files and directories into (image files, rejected files)"""
+    files, rejected = [], []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if name.lower().endswith(extensions))
+        elif path.lower().endswith(extensions):
+            files.append(path)
+        else:
+            rejected.append(path)
+    return files, rejected
+
+def normalize_image(source_path, max_size, image_format='jpeg', quality=90):
+    """Downscale an image to cover max_size and re-encode it to a temporary file
+    
+    Returns the temporary file path, or None when the source already has the
+    target format and size and re-encoding would not make it smaller.
+    """
+    from PIL import Image, ImageOps
+    
+    pil_format = 'WEBP' if image_format == 'webp' else 'JPEG'
+    with Image.open(source_path) as img:
+        same_format = img.format == pil_format
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+            
+        # Escalar para cubrir la pantalla (SDDM recorta el sobrante), nunca ampliar
+        width, height = img.size
+        scale = max(max_size[0] / width, max_size[1] / height)
+        resized = scale < 1
+        if resized:
+            img = img.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+            
+        fd, tmp_path = tempfile.mkstemp(prefix='bg-sddm-', suffix=NORMALIZED_EXTENSIONS[image_format])
+        with os.fdopen(fd, 'wb') as f:
+            if pil_format == 'JPEG':
+                img.save(f, 'JPEG', quality=quality, optimize=True, progressive=True)
+            else:
+                img.save(f, 'WEBP', quality=quality, method=4)
+                
+    if same_format and not resized and os.path.getsize(tmp_path) >= os.path.getsize(source_path):
+        os.unlink(tmp_path)
+        return None
+    return tmp_path
+
+def load_palette_modules():
+    """Import the heavy palette dependencies; used to measure startup with them preloaded"""
+    import numpy
+    import PIL.Image
+    import sklearn.cluster
+
+def quantize_kmeans(pixels, n_colors):
+    """Original KMeans quantizer (10 restarts, slow but stable)"""
+    import numpy as np
+    from sklearn.cluster import KMeans
+    
+    kmeans = KMeans(n_clusters=n_colors, random_state=42, n_init=10)
+    kmeans.fit(pixels)
+    return kmeans.cluster_centers_, np.bincount(kmeans.labels_, minlength=n_colors)
+
+def quantize_minibatch(pixels, n_colors):
+    """MiniBatchKMeans with a single seeded init"""
+    import numpy as np
+    from sklearn.cluster import MiniBatchKMeans
+    
+    kmeans = MiniBatchKMeans(n_clusters=n_colors, random_state=42, n_init=1, batch_size=2048)
+    kmeans.fit(pixels)
+    return kmeans.cluster_centers_, np.bincount(kmeans.labels_, minlength=n_colors)
+
+def quantize_histogram(pixels, n_colors):
+    """Bin pixels into a 16x16x16 color cube and return the means of the most populated bins"""
+    import numpy as np
+    
+    pixels = pixels.astype(np.int64)
+    bins = ((pixels[:, 0] >> 4) << 8) | ((pixels[:, 1] >> 4) << 4) | (pixels[:, 2] >> 4)
+    counts = np.bincount(bins, minlength=4096)
+    sums = np.stack([np.bincount(bins, weights=pixels[:, c], minlength=4096) for c in range(3)], axis=1)
+    
+    top = np.argsort(counts)[::-1][:n_colors]
+    top = top[counts[top] > 0]
+    return sums[top] / counts[top, None], counts[top]
+
+def quantize_median_cut(pixels, n_colors):
+    """Vectorized median cut: repeatedly split the box with the widest channel range at its median"""
+    import numpy as np
+    
+    boxes = [pixels]
+    while len(boxes) < n_colors:
+        ranges = [np.ptp(box, axis=0).max() if len(box) > 1 else -1 for box in boxes]
+        index = int(np.argmax(ranges))
+        if ranges[index] <= 0:
+            break
+            
+        box = boxes.pop(index)
+        channel = int(np.argmax(np.ptp(box, axis=0)))
+        box = box[np.argsort(box[:, channel], kind='stable')]
+        middle = len(box) // 2
+        boxes.extend([box[:middle], box[middle:]])
+        
+    colors = np.array([box.mean(axis=0) for box in boxes])
+    counts = np.array([len(box) for box in boxes])
+    return colors, counts
+
+# Backends de cuantización disponibles para extraer la paleta
+PALETTE_BACKENDS = {
+    'histogram': quantize_histogram,
+    'median_cut': quantize_median_cut,
+    'minibatch': quantize_minibatch,
+    'kmeans': quantize_kmeans
+}
+DEFAULT_PALETTE_BACKEND = 'histogram'
+
+def compute_dominant_colors(image_path, backend=DEFAULT_PALETTE_BACKEND, n_colors=5):
+    """Quantize an image and return its dominant colors as hex, most frequent first (None on error)"""
+    with TRACER.span('palette', backend=backend, image=os.path.basename(image_path)):
         try:
+            import numpy as np
+            from PIL import Image
+            
             # Open and resize image for faster processing
             with Image.open(image_path) as img:
+                # Let JPEG decode at a reduced scale instead of full resolution
+                img.draft('RGB', (300, 300))
+                
                 # Convert to RGB if needed
                 if img.mode != 'RGB':
                     img = img.convert('RGB')
@@ -52,1043 +284,1212 @@ class SDDMBackgroundChanger(Gtk.Application):
                 # Get image data as numpy array
                 img_array = np.array(img)
                 pixels = img_array.reshape(-1, 3)
-                
-                # Use KMeans to find dominant colors
-                kmeans = KMeans(n_clusters=5, random_state=42, n_init=10)
-                kmeans.fit(pixels)
-                
-                # Get the colors and their frequencies
-                colors = kmeans.cluster_centers_.astype(int)
-                
-                # Sort by frequency (cluster size)
-                labels = kmeans.labels_
-                label_counts = np.bincount(labels)
-                dominant_colors = [colors[i] for i in np.argsort(label_counts)[::-1]]
-                
-                # Convert to hex
-                hex_colors = ['#{:02x}{:02x}{:02x}'.format(int(r), int(g), int(b)) for r, g, b in dominant_colors]
-                
-                return self.generate_theme_from_colors(hex_colors)
-                
+            
+            # Get the colors and their frequencies
+            quantize = PALETTE_BACKENDS[backend]
+            colors, counts = quantize(pixels, n_colors)
+            
+            # Sort by frequency (cluster size)
+            dominant_colors = [colors[i] for i in np.argsort(counts, kind='stable')[::-1]]
+            
+            # Convert to hex
+            return ['#{:02x}{:02x}{:02x}'.format(int(r), int(g), int(b)) for r, g, b in dominant_colors]
+        
         except Exception as e:
             print(f"Error extracting colors: {e}")
-            return self.get_default_theme()
+            return None
+
+def precompute_palettes(image_paths, palette_index, backend=DEFAULT_PALETTE_BACKEND,
+                        max_workers=None, progress_callback=None, cancel_event=None):
+    """Extract and index the palettes of many images in a process pool
     
-    def generate_theme_from_colors(self, colors):
-        """Generate a theme from extracted colors"""
-        # Get the most dominant color
-        primary_color = colors[0]
-        
-        # Convert to HSL for better color manipulation
-        rgb = tuple(int(primary_color[i:i+2], 16) for i in (1, 3, 5))
-        h, l, s = colorsys.rgb_to_hls(rgb[0]/255, rgb[1]/255, rgb[2]/255)
-        
-        # Generate complementary colors
-        # Dark background
-        dark_l = max(0.05, l * 0.1)  # Very dark version
-        dark_rgb = colorsys.hls_to_rgb(h, dark_l, s)
-        dark_color = '#{:02x}{:02x}{:02x}'.format(
-            int(dark_rgb[0] * 255), int(dark_rgb[1] * 255), int(dark_rgb[2] * 255)
-        )
-        
-        # Medium background  
-        medium_l = max(0.1, l * 0.2)  # Dark version
-        medium_rgb = colorsys.hls_to_rgb(h, medium_l, s)
-        medium_color = '#{:02x}{:02x}{:02x}'.format(
-            int(medium_rgb[0] * 255), int(medium_rgb[1] * 255), int(medium_rgb[2] * 255)
-        )
-        
-        # Accent color (brighter version)
-        accent_l = min(0.7, l * 1.5)
-        accent_rgb = colorsys.hls_to_rgb(h, accent_l, min(1.0, s * 1.2))
-        accent_color = '#{:02x}{:02x}{:02x}'.format(
-            int(accent_rgb[0] * 255), int(accent_rgb[1] * 255), int(accent_rgb[2] * 255)
-        )
-        
-        # Text color (high contrast)
-        text_color = '#e0e0e0' if l < 0.5 else '#2c3e50'
-        
-        return {
-            'primary': dark_color,
-            'secondary': medium_color,
-            'accent': accent_color,
-            'text': text_color,
-            'original': primary_color
-        }
+    Images already in the index are skipped. progress_callback(done, total, path)
+    is called from the calling thread after every image. Returns (computed, failed).
+    """
+    pending = [path for path in image_paths if palette_index.get(path, backend) is None]
+    if not pending:
+        return 0, 0
+        
+    computed = failed = 0
+    # 'spawn' evita heredar el estado de GTK y los hilos del proceso principal
+    context = multiprocessing.get_context('spawn')
+    workers = max_workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=context)
+    try:
+        futures = {executor.submit(compute_dominant_colors, path, backend): path for path in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            colors = future.result()
+            if colors:
+                palette_index.put(path, colors, backend, save=False)
+                computed += 1
+            else:
+                failed += 1
+                
+            if progress_callback:
+                progress_callback(done, len(pending), path)
+            if cancel_event and cancel_event.is_set():
+                break
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        palette_index.save()
+        
+    return computed, failed
+
+def file_content_hash(path):
+    """Fast content hash (BLAKE2b, 128 bits) of a file"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def perceptual_hash(path):
+    """64-bit difference hash (dHash) used to detect near-duplicate images"""
+    from PIL import Image
     
-    def get_default_theme(self):
-        """Get default theme colors"""
-        return {
-            'primary': '#1a1a1a',
-            'secondary': '#2d2d2d', 
-            'accent': '#4CAF50',
-            'text': '#e0e0e0'
-        }
+    with Image.open(path) as img:
+        img.draft('L', (64, 64))
+        pixels = img.convert('L').resize((9, 8), Image.BILINEAR).tobytes()
+        
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+def hamming_distance(a, b):
+    """Number of differing bits between two perceptual hashes"""
+    return bin(a ^ b).count('1')
+
+class JSONIndex:
+    """Per-file entries kept in one JSON file under CACHE_DIR, loaded lazily and saved atomically"""
     
-    def apply_dynamic_theme(self, colors):
-        """Apply dynamic theme based on extracted colors"""
-        self.current_theme_colors = colors
-        
-        # Update CSS with new colors
-        css = f"""
-        /* Main window styling */
-        window {{
-            background-color: {colors['primary']};
-        }}
-        
-        /* Header bar styling */
-        headerbar {{
-            background: {colors['secondary']};
-            color: white;
-            border-bottom: 1px solid rgba(255,255,255,0.1);
-        }}
-        
-        headerbar button {{
-            background: rgba(255,255,255,0.1);
-            border: 1px solid rgba(255,255,255,0.2);
-            border-radius: 6px;
-            color: white;
-        }}
-        
-        headerbar button:hover {{
-            background: rgba(255,255,255,0.2);
-        }}
-        
-        /* Main content area */
-        .main-content {{
-            background: {colors['secondary']};
-            border-radius: 12px;
-            margin: 20px;
-            color: {colors['text']};
-        }}
-        
-        /* Image containers */
-        .image-container {{
-            background: {colors['secondary']};
-            border-radius: 12px;
-            margin: 8px;
-            padding: 12px;
-        }}
-        
-        .image-container:hover {{
-            background-color: {colors['accent']};
-            background-image: linear-gradient(rgba(255,255,255,0.1), rgba(255,255,255,0.1));
-            box-shadow: 0 4px 12px rgba(0,0,0,0.3);
-        }}
-        
-        .image-container.current {{
-            border: 3px solid {colors['accent']};
-        }}
-        
-        /* Flow box styling */
-        flowbox {{
-            background: transparent;
-        }}
-        
-        flowboxchild {{
-            background: transparent;
-            border-radius: 12px;
-            margin: 4px;
-        }}
-        
-        flowboxchild:selected {{
-            background: rgba(102,126,234,0.1);
-        }}
-        
-        /* Status bar */
-        .status-bar {{
-            background: {colors['secondary']};
-            border-radius: 8px;
-            padding: 8px 12px;
-            color: {colors['text']};
-        }}
-        
-        /* Scrolled window */
-        scrolledwindow {{
-            background: transparent;
-        }}
-        
-        /* Text elements */
-        label {{
-            color: {colors['text']};
-        }}
-        
-        .dim-label {{
-            color: {colors['text']};
-            opacity: 0.7;
-        }}
-        
-        /* Image labels */
-        .image-label {{
-            color: {colors['text']};
-        }}
-        
-        .current-label {{
-            color: {colors['accent']};
-            font-weight: bold;
-        }}
-        
-        /* Buttons */
-        button.add-button {{
-            background: {colors['accent']};
-            color: white;
-            border: none;
-            border-radius: 8px;
-            padding: 8px 16px;
-            font-weight: bold;
-        }}
-        
-        button.add-button:hover {{
-            background: {colors['accent']};
-            opacity: 0.8;
-        }}
-        
-        /* Delete button styling */
-        .delete-button {{
-            background: rgba(255, 71, 87, 0.9);
-            color: white;
-            border: none;
-            border-radius: 12px;
-            padding: 6px;
-            font-size: 14px;
-            font-weight: normal;
-            opacity: 0.0;
-            margin: 4px;
-        }}
-        
-        .image-container:hover .delete-button {{
-            opacity: 1.0;
-        }}
-        
-        .delete-button:hover {{
-            background: rgba(255, 71, 87, 0.9);
-            color: white;
-            border: none;
-            opacity: 1.0;
-        }}
-        
-        .delete-button:active {{
-            background: rgba(255, 55, 66, 1.0);
-            color: white;
-        }}
-        
-        /* Drag and drop styling */
-        .drop-target {{
-            border: 3px dashed {colors['accent']};
-            border-radius: 8px;
-            background-color: rgba(0, 0, 0, 0.1);
-        }}
-        
-        .drag-highlight {{
-            background-color: rgba(100, 150, 255, 0.2);
-        }}
-        """
-        
-        # Apply the new CSS
-        if self.css_provider:
-            screen = Gdk.Screen.get_default()
-            style_context = Gtk.StyleContext()
-            style_context.remove_provider_for_screen(screen, self.css_provider)
-        
-        self.css_provider = Gtk.CssProvider()
-        self.css_provider.load_from_data(css.encode())
-        screen = Gdk.Screen.get_default()
-        style_context = Gtk.StyleContext()
-        style_context.add_provider_for_screen(screen, self.css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+    FILENAME = None
+    DESCRIPTION = 'index'
     
-    def setup_css(self):
-        """Setup initial CSS styling for the application"""
-        # Apply default theme initially
-        self.apply_dynamic_theme(self.current_theme_colors)
-        
-    def do_activate(self):
-        self.win = SDDMWindow(application=self)
-        self.win.show_all()
-
-class SDDMWindow(Gtk.ApplicationWindow):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.set_title('SDDM Background Changer')
-        self.set_default_size(900, 700)
-        self.set_resizable(True)
-        self.set_position(Gtk.WindowPosition.CENTER)
-        
-        self.theme_path = '/usr/share/sddm/themes/sddm-astronaut-theme'
-        self.backgrounds_path = f'{self.theme_path}/Backgrounds'
-        self.config_path = f'{self.theme_path}/Themes/theme1.conf'
-        
-        # Configuration and settings
-        self.config_file = os.path.expanduser('~/.config/bg-sddm/settings.json')
-        self.load_app_settings()
-        
-        self.setup_ui()
-        self.load_backgrounds()
-        
-        # Apply dynamic theme based on current background
-        self.apply_initial_theme()
-        
-    def load_app_settings(self):
-        """Load application settings from config file"""
-        self.settings = {
-            'window_width': 900,
-            'window_height': 700,
-            'grid_columns': 4,
-            'last_used_theme': self.theme_path,
-            'preview_size': 160
-        }
-        
-        try:
-            config_dir = os.path.dirname(self.config_file)
-            if not os.path.exists(config_dir):
-                os.makedirs(config_dir, exist_ok=True)
-                
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    saved_settings = json.load(f)
-                    self.settings.update(saved_settings)
-                    
-        except Exception as e:
-            print(f"Error loading settings: {e}")
+    def __init__(self, index_path=None):
+        self.index_path = index_path or os.path.join(CACHE_DIR, self.FILENAME)
+        self.entries = None
+        self.lock = threading.Lock()
+        
+    def load(self):
+        """Read the index from disk once (callers hold self.lock)"""
+        if self.entries is None:
+            self.entries = load_json(self.index_path, {}, self.DESCRIPTION)
             
-    def save_app_settings(self):
-        """Save application settings to config file"""
-        try:
-            # Update current window size
-            width, height = self.get_size()
-            self.settings['window_width'] = width
-            self.settings['window_height'] = height
+    def save(self):
+        """Write the index atomically"""
+        with self.lock:
+            if self.entries is not None:
+                save_json(self.index_path, self.entries, self.DESCRIPTION)
+
+class ContentIndex(JSONIndex):
+    """Content-addressed index of the backgrounds in ~/.cache/bg-sddm/content_index.json
+    
+    Each entry holds the file's BLAKE2b hash, an optional perceptual hash and,
+    for imported files, the hash of the source they were created from.
+    """
+    
+    FILENAME = 'content_index.json'
+    DESCRIPTION = 'content index'
+    
+    def compute_record(self, path, use_phash=True):
+        """Hash a file and return a new index record"""
+        st = os.stat(path)
+        record = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'hash': file_content_hash(path), 'phash': None}
+        if use_phash:
+            try:
+                record['phash'] = perceptual_hash(path)
+            except Exception as e:
+                print(f"Debug - Could not compute perceptual hash of {path}: {e}")
+        return record
+        
+    def put(self, path, record):
+        """Store a record for a file"""
+        with self.lock:
+            self.load()
+            self.entries[os.path.abspath(path)] = record
             
-            config_dir = os.path.dirname(self.config_file)
-            if not os.path.exists(config_dir):
-                os.makedirs(config_dir, exist_ok=True)
-                
-            with open(self.config_file, 'w') as f:
-                json.dump(self.settings, f, indent=2)
+    def refresh(self, directory, use_phash=True):
+        """Bring the entries of a directory up to date, hashing only new or modified files"""
+        directory = os.path.abspath(directory)
+        current = {}
+        for name in list_background_images(directory):
+            path = os.path.join(directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
                 
-        except Exception as e:
-            print(f"Error saving settings: {e}")
+            with self.lock:
+                self.load()
+                record = self.entries.get(path)
+            stale = not record or record['size'] != st.st_size or record['mtime_ns'] != st.st_mtime_ns
+            if stale or (use_phash and record.get('phash') is None):
+                try:
+                    source_hash = record.get('source_hash') if record and not stale else None
+                    record = self.compute_record(path, use_phash)
+                    if source_hash:
+                        record['source_hash'] = source_hash
+                except OSError:
+                    continue
+                self.put(path, record)
+            current[path] = record
             
-    def apply_initial_theme(self):
-        """Apply dynamic theme based on current background when app starts"""
-        try:
-            current_bg = self.get_current_background()
-            if current_bg:
-                image_path = os.path.join(self.backgrounds_path, current_bg)
-                if os.path.exists(image_path):
-                    app = self.get_application()
-                    colors = app.extract_colors_from_image(image_path)
-                    app.apply_dynamic_theme(colors)
-                    print(f"Debug - Applied initial theme from {current_bg}: {colors}")
-        except Exception as e:
-            print(f"Error applying initial theme: {e}")
-        
-    def setup_ui(self):
-        # Header bar
-        header_bar = Gtk.HeaderBar()
-        header_bar.set_show_close_button(True)
-        header_bar.set_title('SDDM Background Changer')
-        self.set_titlebar(header_bar)
-        
-        # Add image button
-        add_button = Gtk.Button()
-        add_button.set_image(Gtk.Image.new_from_icon_name('list-add-symbolic', Gtk.IconSize.BUTTON))
-        add_button.set_tooltip_text('Añadir nueva imagen')
-        add_button.connect('clicked', self.on_add_image_clicked)
-        header_bar.pack_start(add_button)
-        
-        # Refresh button
-        refresh_button = Gtk.Button()
-        refresh_button.set_image(Gtk.Image.new_from_icon_name('view-refresh-symbolic', Gtk.IconSize.BUTTON))
-        refresh_button.set_tooltip_text('Actualizar lista')
-        refresh_button.connect('clicked', self.on_refresh_clicked)
-        header_bar.pack_start(refresh_button)
-        
-        # Settings button
-        settings_button = Gtk.Button()
-        settings_button.set_image(Gtk.Image.new_from_icon_name('preferences-system-symbolic', Gtk.IconSize.BUTTON))
-        settings_button.set_tooltip_text('Configuración')
-        settings_button.connect('clicked', self.on_settings_clicked)
-        header_bar.pack_end(settings_button)
-        
-        # About button
-        about_button = Gtk.Button()
-        about_button.set_image(Gtk.Image.new_from_icon_name('help-about-symbolic', Gtk.IconSize.BUTTON))
-        about_button.set_tooltip_text('Acerca de')
-        about_button.connect('clicked', self.on_about_clicked)
-        header_bar.pack_end(about_button)
-        
-        # Main content
-        main_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=12)
-        main_box.set_margin_top(12)
-        main_box.set_margin_bottom(12)
-        main_box.set_margin_start(12)
-        main_box.set_margin_end(12)
-        
-        # Title and description
-        title_label = Gtk.Label()
-        title_label.set_markup('<span size="large" weight="bold">Cambiar Background de SDDM</span>')
-        title_label.set_halign(Gtk.Align.START)
-        main_box.pack_start(title_label, False, False, 0)
-        
-        desc_label = Gtk.Label()
-        desc_label.set_text('Selecciona una imagen para cambiar el fondo de la pantalla de login')
-        desc_label.set_halign(Gtk.Align.START)
-        style_context = desc_label.get_style_context()
-        style_context.add_class('dim-label')
-        main_box.pack_start(desc_label, False, False, 0)
-        
-        # Scrolled window for image grid
-        scrolled = Gtk.ScrolledWindow()
-        scrolled.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
-        scrolled.set_vexpand(True)
-        
-        # Flow box for images
-        self.flow_box = Gtk.FlowBox()
-        self.flow_box.set_valign(Gtk.Align.START)
-        self.flow_box.set_max_children_per_line(4)
-        self.flow_box.set_selection_mode(Gtk.SelectionMode.SINGLE)
-        self.flow_box.connect('child-activated', self.on_image_selected)
+        # Olvidar archivos que ya no existen en este directorio
+        with self.lock:
+            self.load()
+            for path in [p for p in self.entries if os.path.dirname(p) == directory and p not in current]:
+                del self.entries[path]
+        return current
         
-        # Setup drag and drop for the flow_box
-        self.setup_drag_and_drop()
+    def find_match(self, candidates, content_hash, phash=None, max_distance=0, exclude=None):
+        """Find an exact or near duplicate among candidates ({path: record})
         
-        scrolled.add(self.flow_box)
-        main_box.pack_start(scrolled, True, True, 0)
-        
-        # Status bar
-        self.status_label = Gtk.Label()
-        self.status_label.set_text('Listo')
-        self.status_label.set_halign(Gtk.Align.START)
-        style_context = self.status_label.get_style_context()
-        style_context.add_class('dim-label')
-        main_box.pack_start(self.status_label, False, False, 0)
-        
-        self.add(main_box)
-        
-    def load_backgrounds(self):
-        """Cargar todas las imágenes del directorio de backgrounds"""
-        print("Debug - load_backgrounds() called")
-        
-        # Limpiar flow box
-        for child in self.flow_box.get_children():
-            self.flow_box.remove(child)
-            
-        try:
-            if not os.path.exists(self.backgrounds_path):
-                self.show_error_dialog('No se encontró el directorio de backgrounds')
-                return
-                
-            # Obtener fondo actual
-            current_bg = self.get_current_background()
-            print(f"Debug - Current background: {current_bg}")
-            
-            # Cargar imágenes
-            image_files = []
-            for file in os.listdir(self.backgrounds_path):
-                if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    image_files.append(file)
-                    
-            image_files.sort()
-            print(f"Debug - Found {len(image_files)} image files")
+        Returns (path, 'exact') or (path, 'near'), or None.
+        """
+        near = None
+        for path, record in candidates.items():
+            if path == exclude:
+                continue
+            if content_hash in (record.get('hash'), record.get('source_hash')):
+                return path, 'exact'
+            # Un dHash nulo (imagen plana) no aporta información para comparar
+            if near is None and phash and record.get('phash') and max_distance > 0:
+                if hamming_distance(phash, record['phash']) <= max_distance:
+                    near = (path, 'near')
+        return near
+        
+    def find_duplicate_groups(self, records, max_distance=0):
+        """Group files that are exact or near duplicates of each other, sorted by path"""
+        paths = sorted(records)
+        parent = {path: path for path in paths}
+        
+        def find(path):
+            while parent[path] != path:
+                parent[path] = parent[parent[path]]
+                path = parent[path]
+            return path
             
-            for image_file in image_files:
-                print(f"Debug - Adding image: {image_file}, is_current: {image_file == current_bg}")
-                self.add_image_to_grid(image_file, image_file == current_bg)
+        def union(a, b):
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
                 
-            # Asegurar que el flow_box se muestre
-            self.flow_box.show_all()
+        by_hash = {}
+        for path in paths:
+            by_hash.setdefault(records[path]['hash'], []).append(path)
+        for same in by_hash.values():
+            for other in same[1:]:
+                union(same[0], other)
                 
-            status_text = f'Cargadas {len(image_files)} imágenes'
-            if current_bg:
-                status_text += f' - Actual: {current_bg}'
-            self.status_label.set_text(status_text)
-            
-        except Exception as e:
-            error_msg = f'Error al cargar imágenes: {str(e)}'
-            print(f"Debug - {error_msg}")
-            self.show_error_dialog(error_msg)
+        if max_distance > 0:
+            hashed = [(path, records[path]['phash']) for path in paths if records[path].get('phash')]
+            for i, (path_a, phash_a) in enumerate(hashed):
+                for path_b, phash_b in hashed[i + 1:]:
+                    if hamming_distance(phash_a, phash_b) <= max_distance:
+                        union(path_a, path_b)
+                        
+        groups = {}
+        for path in paths:
+            groups.setdefault(find(path), []).append(path)
+        return [group for group in groups.values() if len(group) > 1]
+
+class PaletteIndex(JSONIndex):
+    """Persistent index of dominant colors per image in ~/.cache/bg-sddm/palettes.json"""
     
-    def setup_drag_and_drop(self):
-        """Setup drag and drop functionality"""
-        # Set up the flow_box as a drop target
-        self.flow_box.drag_dest_set(
-            Gtk.DestDefaults.ALL,
-            [],
-            Gdk.DragAction.COPY
-        )
-        
-        # Add target for files
-        target_list = Gtk.TargetList.new([])
-        target_list.add_uri_targets(0)
-        target_list.add_text_targets(1)
-        self.flow_box.drag_dest_set_target_list(target_list)
-        
-        # Connect drag and drop signals
-        self.flow_box.connect('drag-data-received', self.on_drag_data_received)
-        self.flow_box.connect('drag-motion', self.on_drag_motion)
-        self.flow_box.connect('drag-leave', self.on_drag_leave)
-        
-    def on_drag_motion(self, widget, drag_context, x, y, time):
-        """Handle drag motion over the widget"""
-        # Add visual feedback
-        style_context = widget.get_style_context()
-        style_context.add_class('drag-highlight')
-        
-        # Accept the drag
-        Gdk.drag_status(drag_context, Gdk.DragAction.COPY, time)
-        return True
-        
-    def on_drag_leave(self, widget, drag_context, time):
-        """Handle drag leave"""
-        # Remove visual feedback
-        style_context = widget.get_style_context()
-        style_context.remove_class('drag-highlight')
-        
-    def on_drag_data_received(self, widget, drag_context, x, y, data, info, time):
-        """Handle dropped data"""
-        # Remove visual feedback
-        style_context = widget.get_style_context()
-        style_context.remove_class('drag-highlight')
-        
-        # Get the dropped data
-        uris = data.get_uris()
-        
-        if uris:
-            for uri in uris:
-                # Convert URI to local path
-                file_path = GLib.filename_from_uri(uri)[0]
-                
-                # Check if it's an image file
-                if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
-                    self.add_dropped_image(file_path)
-                else:
-                    self.show_error_dialog(f'Archivo no válido: {os.path.basename(file_path)}\nSolo se permiten imágenes.')
-        
-        # Finish the drag
-        Gtk.drag_finish(drag_context, True, False, time)
-        
-    def add_dropped_image(self, source_path):
-        """Add a dropped image to the backgrounds folder"""
+    FILENAME = 'palettes.json'
+    DESCRIPTION = 'palette index'
+    
+    def get(self, image_path, backend):
+        """Return the cached color list for an image, or None if unknown, modified or from another backend"""
         try:
-            filename = os.path.basename(source_path)
-            dest_path = os.path.join(self.backgrounds_path, filename)
-            
-            # Check if file already exists
-            if os.path.exists(dest_path):
-                dialog = Gtk.MessageDialog(
-                    transient_for=self,
-                    modal=True,
-                    message_type=Gtk.MessageType.QUESTION,
-                    buttons=Gtk.ButtonsType.YES_NO,
-                    text=f'La imagen "{filename}" ya existe.\n¿Deseas reemplazarla?'
-                )
-                response = dialog.run()
-                dialog.destroy()
-                
-                if response != Gtk.ResponseType.YES:
-                    return
+            st = os.stat(image_path)
+        except OSError:
+            return None
             
-            # Copy the file
-            try:
-                shutil.copy2(source_path, dest_path)
-                self.status_label.set_text(f'Imagen añadida: {filename}')
-                self.load_backgrounds()
-                
-            except PermissionError:
-                # Try using pkexec for copying file
-                if self.try_pkexec_copy(source_path, dest_path):
-                    self.status_label.set_text(f'Imagen añadida: {filename}')
-                    self.load_backgrounds()
-                else:
-                    self.show_error_dialog('Error de permisos. No se pudo copiar la imagen.')
-                    
-        except Exception as e:
-            self.show_error_dialog(f'Error al añadir imagen: {str(e)}')
+        with self.lock:
+            self.load()
+            entry = self.entries.get(os.path.abspath(image_path))
             
-    def add_image_to_grid(self, filename, is_current=False):
-        """Añadir una imagen al grid"""
-        image_path = os.path.join(self.backgrounds_path, filename)
-        
-        # Main container
-        main_container = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
-        main_container.set_size_request(180, 160)
-        
-        # Image container with overlay for delete button
-        image_overlay = Gtk.Overlay()
+        if not entry or entry.get('backend') != backend:
+            return None
+        if entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns:
+            return entry.get('colors')
+        return None
         
-        # Imagen
+    def put(self, image_path, colors, backend, save=True):
+        """Store the color list for an image"""
         try:
-            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(image_path, 160, 90, True)
-            image = Gtk.Image.new_from_pixbuf(pixbuf)
-        except:
-            # Si no se puede cargar la imagen, mostrar icono
-            image = Gtk.Image.new_from_icon_name('image-x-generic', Gtk.IconSize.DIALOG)
+            st = os.stat(image_path)
+        except OSError:
+            return
             
-        image.set_size_request(160, 90)
-        image_overlay.add(image)
-        
-        # Delete button (only if not current background)
-        if not is_current:
-            delete_button = Gtk.Button()
-            delete_button.set_label('×')
-            delete_button.set_tooltip_text(f'Eliminar {filename}')
-            delete_button.set_size_request(24, 24)
-            delete_button.get_style_context().add_class('delete-button')
-            delete_button.set_halign(Gtk.Align.END)
-            delete_button.set_valign(Gtk.Align.START)
-            delete_button.set_margin_top(4)
-            delete_button.set_margin_end(4)
-            delete_button.connect('clicked', self.on_delete_image, filename)
-            image_overlay.add_overlay(delete_button)
-        
-        main_container.pack_start(image_overlay, False, False, 0)
-        
-        # Label con nombre
-        label = Gtk.Label()
-        label.set_text(filename)
-        label.set_ellipsize(3)  # Pango.EllipsizeMode.END
-        label.set_max_width_chars(20)
-        main_container.pack_start(label, False, False, 0)
-        
-        # Indicador de imagen actual
-        if is_current:
-            current_label = Gtk.Label()
-            current_label.set_markup('<span color="#4CAF50" weight="bold">● Actual</span>')
-            main_container.pack_start(current_label, False, False, 0)
-        
-        # Setup hover effect
-        self.setup_hover_effect(main_container)
+        with self.lock:
+            self.load()
+            self.entries[os.path.abspath(image_path)] = {
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+                'colors': colors,
+                'backend': backend
+            }
+        if save:
+            self.save()
+
+DEFAULT_SETTINGS = {
+        'window_width': 900,
+        'window_height': 700,
+        'grid_columns': 4,
+        'last_used_theme': DEFAULT_THEME_PATH,
+        'preview_size': 160,
+        'thumbnail_cache_mb': 128,
+        'shared_thumbnails': True,
+        'lazy_grid': True,
+        'palette_backend': DEFAULT_PALETTE_BACKEND,
+        'keep_privileged_helper': False,
+        'normalize_on_import': False,
+        'normalize_format': 'jpeg',
+        'normalize_quality': 90,
+        'normalize_resolution': '',
+        'keep_originals': True,
+        'duplicate_policy': 'skip',
+        'near_duplicate_distance': 6,
+        'config_backups': 5,
+        'rotation_policy': 'shuffle',
+        'rotation_period': 'always',
+        'rotation_weights': {},
+        'rotation_buckets': {},
+        'last_palette': None
+}
+
+def load_settings(settings_file=SETTINGS_FILE):
+    """Application settings from settings.json merged over the defaults"""
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(load_json(settings_file, {}, 'settings'))
+    return settings
+
+class ThemeConfig:
+    """Parsed model of an SDDM theme config (theme1.conf), re-read only when its mtime changes
+    
+    The file is kept as a list of lines so comments, blank lines and key order
+    survive a rewrite; only the lines of the keys that are set get replaced.
+    Keys are matched case-insensitively (some themes use background=).
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.stamp = None
+        self.lines = []
+        self.keys = {}
+        
+    def invalidate(self):
+        """Force a re-read on the next access"""
+        self.stamp = None
+        
+    def refresh(self):
+        """Re-parse the file if it changed on disk since the last read"""
+        st = os.stat(self.path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self.stamp:
+            return
             
-        # Guardar filename como data
-        main_container.filename = filename
-        
-        self.flow_box.add(main_container)
-        
-    def setup_hover_effect(self, container):
-        """Setup hover effect for image containers"""
-        # Add CSS class for styling
-        container.get_style_context().add_class('image-container')
-        
-        # Connect mouse events
-        container.add_events(Gdk.EventMask.ENTER_NOTIFY_MASK | 
-                           Gdk.EventMask.LEAVE_NOTIFY_MASK)
-        container.connect('enter-notify-event', self.on_image_enter)
-        container.connect('leave-notify-event', self.on_image_leave)
-        
-    def on_image_enter(self, widget, event):
-        """Handle mouse enter on image"""
-        # The hover effect is handled by CSS, but we can add additional logic here if needed
-        return False
-        
-    def on_image_leave(self, widget, event):
-        """Handle mouse leave on image"""
-        # The hover effect is handled by CSS, but we can add additional logic here if needed
-        return False
-        
-    def on_delete_image(self, button, filename):
-        """Handle image deletion"""
-        # Confirm deletion
-        dialog = Gtk.MessageDialog(
-            transient_for=self,
-            modal=True,
-            message_type=Gtk.MessageType.WARNING,
-            buttons=Gtk.ButtonsType.YES_NO,
-            text=f'¿Estás seguro de que quieres eliminar "{filename}"?'
-        )
-        dialog.format_secondary_text('Esta acción no se puede deshacer.')
-        
-        response = dialog.run()
-        dialog.destroy()
-        
-        if response == Gtk.ResponseType.YES:
-            self.delete_background_image(filename)
+        with TRACER.span('config_parse'):
+            with open(self.path, 'r') as f:
+                self.lines = f.read().split('\n')
+            self.stamp = stamp
             
-    def delete_background_image(self, filename):
-        """Delete a background image"""
-        try:
-            image_path = os.path.join(self.backgrounds_path, filename)
+            # Índice de la primera línea de cada clave (se ignoran comentarios y secciones)
+            self.keys = {}
+            for index, line in enumerate(self.lines):
+                stripped = line.strip()
+                if not stripped or stripped[0] in '#;[' or '=' not in stripped:
+                    continue
+                self.keys.setdefault(stripped.split('=', 1)[0].strip().lower(), index)
             
-            # Check if this is the current background
-            current_bg = self.get_current_background()
-            if filename == current_bg:
-                self.show_error_dialog('No puedes eliminar el fondo de pantalla actual.\nPrimero cambia a otro fondo.')
-                return
+    def get(self, key, default=None):
+        """Value of a key with surrounding quotes removed"""
+        self.refresh()
+        index = self.keys.get(key.lower())
+        if index is None:
+            return default
+        return self.lines[index].split('=', 1)[1].strip().strip('"')
+        
+    def get_bool(self, key, default=False):
+        value = self.get(key)
+        return default if value is None else value.lower() == 'true'
+        
+    def get_int(self, key, default=0):
+        try:
+            return int(self.get(key))
+        except (TypeError, ValueError):
+            return default
             
-            # Try to delete directly first
-            try:
-                os.remove(image_path)
-                self.status_label.set_text(f'Imagen eliminada: {filename}')
-                self.load_backgrounds()
+    def get_background(self):
+        """Filename of the configured background"""
+        value = self.get('Background')
+        return os.path.basename(value) if value else None
+        
+    def render(self, updates):
+        """Return the file content with some keys changed, without modifying the model
+        
+        Values are written quoted when the existing value is quoted (or for
+        new keys holding strings); booleans become true/false.
+        """
+        self.refresh()
+        lines = list(self.lines)
+        for key, value in updates.items():
+            if isinstance(value, bool):
+                text = 'true' if value else 'false'
+            else:
+                text = str(value)
                 
-            except PermissionError:
-                # Try using pkexec for deletion
-                if self.try_pkexec_delete(image_path):
-                    self.status_label.set_text(f'Imagen eliminada: {filename}')
-                    self.load_backgrounds()
-                else:
-                    self.show_error_dialog('Error de permisos. No se pudo eliminar la imagen.')
-                    
-        except Exception as e:
-            self.show_error_dialog(f'Error al eliminar imagen: {str(e)}')
-            
-    def try_pkexec_delete(self, file_path):
-        """Try to delete file using pkexec"""
+            index = self.keys.get(key.lower())
+            if index is None:
+                quoted = isinstance(value, str)
+                # Añadir antes de la línea vacía final para conservar el salto de línea
+                position = len(lines) - 1 if lines and not lines[-1] else len(lines)
+                lines.insert(position, f'{key}="{text}"' if quoted else f'{key}={text}')
+            else:
+                # Se conserva la grafía de la clave y el estilo de comillas del archivo
+                name, old_value = (part.strip() for part in lines[index].split('=', 1))
+                quoted = old_value.startswith('"')
+                lines[index] = f'{name}="{text}"' if quoted else f'{name}={text}'
+        return '\n'.join(lines)
+        
+    def render_background(self, filename):
+        """File content with Background= pointing to an image in Backgrounds/"""
+        return self.render({'Background': f'Backgrounds/{filename}'})
+
+def theme_config_path(theme_path):
+    """Config file of a theme: Themes/theme1.conf, else metadata.desktop's ConfigFile, else theme.conf"""
+    default = os.path.join(theme_path, 'Themes', 'theme1.conf')
+    if os.path.exists(default):
+        return default
+        
+    try:
+        with open(os.path.join(theme_path, 'metadata.desktop'), 'r') as f:
+            for line in f:
+                key, _, value = line.partition('=')
+                if key.strip() == 'ConfigFile' and value.strip():
+                    return os.path.join(theme_path, value.strip())
+    except OSError:
+        pass
+    return os.path.join(theme_path, 'theme.conf')
+
+class SDDMTheme:
+    """An installed SDDM theme and the files this app edits in it"""
+    
+    def __init__(self, path):
+        self.path = os.path.normpath(path)
+        self.name = os.path.basename(self.path)
+        self.config_path = theme_config_path(self.path)
+        self.backgrounds_path = os.path.join(self.path, 'Backgrounds')
+        
+def discover_themes(themes_dir=SDDM_THEMES_DIR):
+    """Installed themes that have a config file, sorted by name"""
+    themes = []
+    try:
+        with os.scandir(themes_dir) as entries:
+            paths = sorted(entry.path for entry in entries if entry.is_dir())
+    except OSError:
+        return themes
+        
+    for path in paths:
+        theme = SDDMTheme(path)
+        if os.path.isfile(theme.config_path):
+            themes.append(theme)
+    return themes
+
+def list_config_backups(path):
+    """Timestamped backups of a config file, oldest first"""
+    directory, name = os.path.split(path)
+    prefix = f'{name}.backup-'
+    try:
+        backups = [entry for entry in os.listdir(directory) if entry.startswith(prefix)]
+    except OSError:
+        return []
+    # El sello YYYYmmdd-HHMMSS ordena cronológicamente
+    return [os.path.join(directory, entry) for entry in sorted(backups)]
+
+def config_write_operations(path, content, keep_backups=5):
+    """File operations that back up a config, prune old backups and replace it atomically
+    
+    The same list runs either directly (apply_file_operations) or through
+    PrivilegedHelper, so both paths write the config the same way.
+    """
+    operations = []
+    if keep_backups > 0 and os.path.exists(path):
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        backup_path = f'{path}.backup-{stamp}'
+        existing = [backup for backup in list_config_backups(path) if backup != backup_path]
+        operations.append(('copy', path, backup_path))
+        for old_backup in existing[:max(0, len(existing) - keep_backups + 1)]:
+            operations.append(('delete', old_backup))
+    operations.append(('write', path, content))
+    return operations
+
+def atomic_write(path, content):
+    """Write a file through a synced temp file in the same directory and rename it over the original"""
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
         try:
-            result = subprocess.run([
-                'pkexec', 'rm', file_path
-            ], capture_output=True, text=True)
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+        
+    # Persistir también la entrada del directorio tras el rename
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def load_json(path, default, description):
+    """Parsed contents of a JSON file, or default if it is missing or unreadable"""
+    try:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f)
+    except Exception as e:
+        print(f"Error loading {description}: {e}")
+    return default
+
+def save_json(path, data, description):
+    """Write data as JSON through atomic_write; errors are reported, not raised"""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        atomic_write(path, json.dumps(data))
+    except Exception as e:
+        print(f"Error saving {description}: {e}")
+
+def apply_file_operations(operations):
+    """Execute PrivilegedHelper-style operations as the current user; returns a list of success flags
+    
+    PermissionError is propagated so the caller can retry the batch elevated.
+    """
+    results = []
+    for operation in operations:
+        kind = operation[0]
+        try:
+            if kind == 'copy':
+                shutil.copy2(operation[1], operation[2])
+            elif kind == 'delete':
+                if os.path.exists(operation[1]):
+                    os.remove(operation[1])
+            elif kind == 'mkdir':
+                os.makedirs(operation[1], exist_ok=True)
+            elif kind == 'write':
+                atomic_write(operation[1], operation[2])
+            else:
+                raise ValueError(f'Unknown file operation: {kind}')
+            results.append(True)
+        except PermissionError:
+            raise
+        except OSError as e:
+            print(f"Error in file operation {kind}: {e}")
+            results.append(False)
+    return results
+
+def run_file_operations(operations, helper=None):
+    """Run operations as the current user, handing the rest of the batch to helper at the first PermissionError"""
+    results = []
+    for index, operation in enumerate(operations):
+        try:
+            results.extend(apply_file_operations([operation]))
+        except PermissionError:
+            remaining = operations[index:]
+            # Lo ya hecho no se repite; el resto va en una sola invocación elevada
+            results.extend(helper.run(remaining) if helper else [False] * len(remaining))
+            break
+    return results
+
+class PrivilegedHelper:
+    """Run batches of file operations as root through the bg-sddm-helper script
+    
+    Operations are tuples: ('copy', source, dest), ('delete', path),
+    ('mkdir', path) or ('write', dest, content). pkexec only runs the installed
+    helper (polkit action org.bg-sddm.helper), which accepts nothing but these
+    operations inside the Backgrounds and Themes folders of the SDDM themes and
+    writes atomically. With keep_alive the helper stays open for the session, so
+    polkit only asks for authentication once.
+    """
+    
+    DONE_MARKER = 'bg-sddm-done'
+    
+    def __init__(self, keep_alive=False, helper_path=PRIVILEGED_HELPER):
+        self.keep_alive = keep_alive
+        self.helper_path = helper_path
+        self.process = None
+        self.lock = threading.Lock()
+        
+    @staticmethod
+    def build_request(operations):
+        """One JSON line per batch; the helper answers one status line per operation"""
+        return json.dumps([list(operation) for operation in operations]) + '\n'
+        
+    def run(self, operations):
+        """Execute all operations in one elevated invocation; returns a list of success flags"""
+        results = [False] * len(operations)
+        if not operations:
+            return results
+        if not os.path.exists(self.helper_path):
+            print(f"Error: privileged helper not installed at {self.helper_path} (run install.sh)")
+            return results
             
-            return result.returncode == 0
-        except Exception as e:
-            print(f"pkexec delete failed: {e}")
-            return False
-        
-    def get_current_background(self):
-        """Obtener el fondo actual del archivo de configuración"""
         try:
-            with open(self.config_path, 'r') as f:
-                content = f.read()
-                
-            for line in content.split('\n'):
-                if line.strip().startswith('Background=') and not 'DimBackground' in line and not 'CropBackground' in line and not 'HaveFormBackground' in line:
-                    bg_path = line.split('=', 1)[1].strip().strip('"')
-                    # Extraer solo el nombre del archivo
-                    filename = os.path.basename(bg_path)
-                    print(f"Debug - Current background from config: {filename}")
-                    return filename
-                    
+            with self.lock:
+                for line in self.execute(self.build_request(operations)):
+                    index, status = line.split(' ', 1)
+                    results[int(index)] = status == 'ok'
         except Exception as e:
-            print(f'Error al leer configuración: {e}')
+            print(f"pkexec batch failed: {e}")
+            self.close()
             
-        return None
+        return results
         
-    def on_image_selected(self, flow_box, child):
-        """Manejar selección de imagen"""
-        container = child.get_child()
-        filename = getattr(container, 'filename', None)
-        
-        if filename:
-            self.change_background(filename)
+    def execute(self, request):
+        """Send a batch to the elevated helper and collect its status lines"""
+        if not self.keep_alive:
+            result = subprocess.run(['pkexec', self.helper_path], input=request, stdout=subprocess.PIPE, text=True)
+            return [line for line in result.stdout.splitlines() if line != self.DONE_MARKER]
             
-    def change_background(self, filename):
-        """Cambiar el fondo en el archivo de configuración"""
-        try:
-            # Extraer colores de la imagen seleccionada y aplicar tema dinámico
-            image_path = os.path.join(self.backgrounds_path, filename)
-            if os.path.exists(image_path):
-                app = self.get_application()
-                colors = app.extract_colors_from_image(image_path)
-                app.apply_dynamic_theme(colors)
-                print(f"Debug - Applied dynamic theme from {filename}: {colors}")
+        if self.process is None or self.process.poll() is not None:
+            self.process = subprocess.Popen(
+                ['pkexec', self.helper_path],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1
+            )
             
-            # Leer archivo actual
-            with open(self.config_path, 'r') as f:
-                content = f.read()
-                
-            # Reemplazar línea de background
-            lines = content.split('\n')
-            for i, line in enumerate(lines):
-                if line.strip().startswith('Background=') and not 'DimBackground' in line and not 'CropBackground' in line and not 'HaveFormBackground' in line:
-                    lines[i] = f'Background="Backgrounds/{filename}"'
-                    break
-                    
-            # Escribir archivo modificado
-            new_content = '\n'.join(lines)
-            
-            # Intentar escribir directamente primero
+        self.process.stdin.write(request)
+        self.process.stdin.flush()
+        
+        lines = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                # El ayudante terminó (autenticación cancelada o denegada)
+                self.process = None
+                break
+            line = line.strip()
+            if line == self.DONE_MARKER:
+                break
+            lines.append(line)
+        return lines
+        
+    def close(self):
+        """Terminate the long-lived elevated helper"""
+        if self.process and self.process.poll() is None:
             try:
-                # Crear respaldo
-                backup_path = f'{self.config_path}.backup'
-                shutil.copy2(self.config_path, backup_path)
+                self.process.stdin.close()
+                self.process.wait(timeout=2)
+            except Exception:
+                self.process.kill()
+        self.process = None
+
+def write_config_file(path, content, keep_backups=5, helper=None):
+    """Write a config atomically with rotating backups, finishing the batch elevated on PermissionError"""
+    with TRACER.span('config_write', path=path):
+        results = run_file_operations(config_write_operations(path, content, keep_backups), helper)
+    # La última operación es la escritura del archivo
+    return results[-1]
+
+def set_background_for_themes(themes, image_path, keep_backups=5, helper=None):
+    """Point several themes at one image in a single batch; returns the themes that were updated
+    
+    The image is copied into the Backgrounds folder of every theme that
+    doesn't have it yet, so only one elevated invocation is needed overall.
+    """
+    if not os.path.isfile(image_path):
+        raise FileNotFoundError(image_path)
+        
+    filename = os.path.basename(image_path)
+    operations = []
+    spans = []
+    for theme in themes:
+        start = len(operations)
+        dest = os.path.join(theme.backgrounds_path, filename)
+        if not os.path.exists(dest):
+            if not os.path.isdir(theme.backgrounds_path):
+                operations.append(('mkdir', theme.backgrounds_path))
+            operations.append(('copy', image_path, dest))
+        content = ThemeConfig(theme.config_path).render_background(filename)
+        operations.extend(config_write_operations(theme.config_path, content, keep_backups))
+        spans.append((theme, start, len(operations)))
+        
+    with TRACER.span('config_write', themes=len(themes)):
+        results = run_file_operations(operations, helper)
+    return [theme for theme, start, end in spans if all(results[start:end])]
+
+def import_destinations(files, normalization=None):
+    """Map destination filename -> source path; if a name repeats within the batch the first wins"""
+    copies = {}
+    for source_path in files:
+        name = os.path.basename(source_path)
+        if normalization:
+            # Se conserva el nombre original con la extensión del nuevo formato
+            name = os.path.splitext(name)[0] + NORMALIZED_EXTENSIONS[normalization['format']]
+        copies.setdefault(name, source_path)
+    return copies
+
+def import_backgrounds(jobs, backgrounds_path, content_index, helper, normalization=None,
+                       policy='skip', max_distance=6, progress_callback=None):
+    """Copy (source, dest) jobs concurrently, then elevate the ones that need it in one batch
+    
+    With normalization, each image is first downscaled and re-encoded to a
+    temporary file which is what gets copied into the backgrounds folder.
+    """
+    needs_privilege = []
+    temp_files = []
+    failed = []
+    added = 0
+    
+    # Detección de duplicados contra el índice de contenido y dentro del propio lote
+    existing = {}
+    if policy != 'allow':
+        if progress_callback:
+            progress_callback('Actualizando índice de duplicados...')
+        existing = content_index.refresh(backgrounds_path, use_phash=max_distance > 0)
+    batch_seen = {}
+    duplicates = []
+    index_updates = []
+    duplicate_lock = threading.Lock()
+    
+    def check_duplicate(source, dest):
+        """Return the content record of source, or None if it must be skipped as a duplicate"""
+        record = content_index.compute_record(source, use_phash=max_distance > 0)
+        dest_key = os.path.abspath(dest)
+        with duplicate_lock:
+            match = None
+            for candidates in (existing, batch_seen):
+                match = content_index.find_match(candidates, record['hash'], record['phash'],
+                                                 max_distance, exclude=dest_key)
+                if match:
+                    break
+            if match:
+                duplicates.append((os.path.basename(source), os.path.basename(match[0]), match[1]))
+                if policy == 'skip':
+                    return None
+            batch_seen[dest_key] = record
+        return record
+        
+    def import_one(job):
+        source, dest = job
+        record = None
+        if policy != 'allow':
+            record = check_duplicate(source, dest)
+            if record is None:
+                return None
                 
-                # Escribir nueva configuración
-                with open(self.config_path, 'w') as f:
-                    f.write(new_content)
+        copies = [(source, dest, True)]
+        if normalization:
+            normalized = normalize_image(source, normalization['max_size'],
+                                         normalization['format'], normalization['quality'])
+            if normalized:
+                temp_files.append(normalized)
+                copies = [(normalized, dest, True)]
+                if record:
+                    # El archivo guardado difiere del origen; se recuerda el hash de ambos
+                    record = dict(record, source_hash=record['hash'], hash=file_content_hash(normalized))
+                if normalization['keep_originals']:
+                    original = os.path.join(backgrounds_path, ORIGINALS_DIR, os.path.basename(source))
+                    copies.append((source, original, False))
                     
-                self.status_label.set_text(f'Fondo cambiado a: {filename} - Tema aplicado automáticamente')
-                
-                # Recargar en el hilo principal usando GLib.idle_add
-                GLib.idle_add(self.load_backgrounds)
-                
-                # Mostrar diálogo de confirmación
-                self.show_success_dialog(f'El fondo se ha cambiado a "{filename}".\nEl tema de la aplicación se ha adaptado automáticamente.\nReinicia SDDM para ver los cambios.')
-                
+        pending = []
+        for copy_source, copy_dest, primary in copies:
+            try:
+                os.makedirs(os.path.dirname(copy_dest), exist_ok=True)
+                shutil.copy2(copy_source, copy_dest)
             except PermissionError:
-                # Try using pkexec for privilege escalation
-                if self.try_pkexec_write(new_content):
-                    self.status_label.set_text(f'Fondo cambiado a: {filename}')
-                    GLib.idle_add(self.load_backgrounds)
-                    self.show_success_dialog(f'El fondo se ha cambiado a "{filename}".\nReinicia SDDM para ver los cambios.')
-                else:
-                    self.show_error_dialog('Error de permisos. No se pudo escribir el archivo de configuración.')
-                    
-        except Exception as e:
-            self.show_error_dialog(f'Error al cambiar fondo: {str(e)}')
-            print(f'Debug - Error details: {e}')
-            
-    def on_add_image_clicked(self, button):
-        """Abrir diálogo para añadir nueva imagen"""
-        dialog = Gtk.FileChooserDialog(
-            title='Seleccionar imagen',
-            parent=self,
-            action=Gtk.FileChooserAction.OPEN
-        )
-        
-        dialog.add_button('Cancelar', Gtk.ResponseType.CANCEL)
-        dialog.add_button('Añadir', Gtk.ResponseType.OK)
-        
-        # Filtro para imágenes
-        filter_images = Gtk.FileFilter()
-        filter_images.set_name('Imágenes')
-        filter_images.add_mime_type('image/png')
-        filter_images.add_mime_type('image/jpeg')
-        filter_images.add_mime_type('image/jpg')
-        dialog.add_filter(filter_images)
-        
-        response = dialog.run()
-        if response == Gtk.ResponseType.OK:
-            filename = dialog.get_filename()
-            if filename:
-                source_path = filename
-                filename = os.path.basename(source_path)
-                dest_path = os.path.join(self.backgrounds_path, filename)
+                pending.append((copy_source, copy_dest, primary))
+        if record:
+            index_updates.append((dest, record))
+        return pending
+        
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = {executor.submit(import_one, job): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), 1):
+            job = futures[future]
+            try:
+                pending = future.result()
+                if pending is None:
+                    # Duplicado omitido
+                    continue
+                needs_privilege.extend(pending)
+                if not any(primary for _, _, primary in pending):
+                    added += 1
+            except Exception as e:
+                print(f"Debug - Import of {job[0]} failed: {e}")
+                failed.append(os.path.basename(job[0]))
+            finally:
+                if progress_callback and (done % 10 == 0 or done == len(jobs)):
+                    progress_callback(f'Importando imágenes: {done}/{len(jobs)}')
                 
-                try:
-                    # Copiar archivo
-                    shutil.copy2(source_path, dest_path)
-                    self.status_label.set_text(f'Imagen añadida: {filename}')
-                    self.load_backgrounds()
-                    
-                except PermissionError:
-                    # Try using pkexec for copying file
-                    if self.try_pkexec_copy(source_path, dest_path):
-                        self.status_label.set_text(f'Imagen añadida: {filename}')
-                        self.load_backgrounds()
-                    else:
-                        self.show_error_dialog('Error de permisos. No se pudo copiar la imagen.')
-                except Exception as e:
-                    self.show_error_dialog(f'Error al añadir imagen: {str(e)}')
-                    
-        dialog.destroy()
-        
-        
-    def on_refresh_clicked(self, button):
-        """Actualizar lista de imágenes"""
-        self.load_backgrounds()
-        
-    def show_error_dialog(self, message):
-        """Mostrar diálogo de error"""
-        dialog = Gtk.MessageDialog(
-            transient_for=self,
-            modal=True,
-            message_type=Gtk.MessageType.ERROR,
-            buttons=Gtk.ButtonsType.OK,
-            text=message
-        )
-        dialog.set_title('Error')
-        dialog.run()
-        dialog.destroy()
-        
-    def show_success_dialog(self, message):
-        """Mostrar diálogo de éxito"""
-        dialog = Gtk.MessageDialog(
-            transient_for=self,
-            modal=True,
-            message_type=Gtk.MessageType.INFO,
-            buttons=Gtk.ButtonsType.OK,
-            text=message
-        )
-        dialog.set_title('Éxito')
-        dialog.run()
-        dialog.destroy()
-        
-    def try_pkexec_write(self, content):
-        """Try to write file using pkexec"""
+    if needs_privilege:
+        if progress_callback:
+            progress_callback(f'Copiando {len(needs_privilege)} imágenes con permisos de administrador...')
+        operations = []
+        for directory in sorted({os.path.dirname(dest) for _, dest, _ in needs_privilege}):
+            if not os.path.isdir(directory):
+                operations.append(('mkdir', directory))
+        copy_start = len(operations)
+        operations.extend(('copy', source, dest) for source, dest, _ in needs_privilege)
+        
+        results = helper.run(operations)[copy_start:]
+        for (source, dest, primary), ok in zip(needs_privilege, results):
+            if not primary:
+                if not ok:
+                    print(f"Debug - Could not keep original {source}")
+            elif ok:
+                added += 1
+            else:
+                failed.append(os.path.basename(dest))
+                
+    for path in temp_files:
         try:
-            # Create temporary file
-            import tempfile
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.conf') as tmp:
-                tmp.write(content)
-                tmp_path = tmp.name
-            
-            # Use pkexec to copy the temporary file
-            result = subprocess.run([
-                'pkexec', 'cp', tmp_path, self.config_path
-            ], capture_output=True, text=True)
-            
-            # Clean up
-            os.unlink(tmp_path)
-            
-            return result.returncode == 0
-        except Exception as e:
-            print(f"pkexec write failed: {e}")
-            return False
+            os.unlink(path)
+        except OSError:
+            pass
             
-    def try_pkexec_copy(self, source, dest):
-        """Try to copy file using pkexec"""
+    # Registrar en el índice los archivos que realmente se copiaron
+    for dest, record in index_updates:
+        if os.path.basename(dest) in failed:
+            continue
         try:
-            result = subprocess.run([
-                'pkexec', 'cp', source, dest
-            ], capture_output=True, text=True)
-            
-            return result.returncode == 0
-        except Exception as e:
-            print(f"pkexec copy failed: {e}")
-            return False
+            st = os.stat(dest)
+        except OSError:
+            continue
+        content_index.put(dest, dict(record, size=st.st_size, mtime_ns=st.st_mtime_ns))
+    if policy != 'allow':
+        content_index.save()
+        
+    return added, failed, duplicates
 
-    def on_settings_clicked(self, button):
-        """Show settings dialog"""
-        dialog = SettingsDialog(self)
-        response = dialog.run()
-        
-        if response == Gtk.ResponseType.OK:
-            # Apply settings
-            dialog.apply_settings()
-            self.save_app_settings()
-            self.load_backgrounds()
+def delete_files(paths, helper):
+    """Delete files, elevating the ones that need it in a single batch; returns the deleted paths"""
+    deleted = []
+    needs_privilege = []
+    for path in paths:
+        try:
+            os.remove(path)
+            deleted.append(path)
+        except PermissionError:
+            needs_privilege.append(path)
+        except OSError as e:
+            print(f"Debug - Could not delete {os.path.basename(path)}: {e}")
             
-        dialog.destroy()
-        
-    def on_about_clicked(self, button):
-        """Show about dialog"""
-        about = Gtk.AboutDialog()
-        about.set_transient_for(self)
-        about.set_modal(True)
-        about.set_program_name('SDDM Background Changer')
-        about.set_version('2.0.0')
-        about.set_comments('Una aplicación moderna para cambiar el fondo de SDDM')
-        about.set_website('https://github.com/rhythmcreative/bg-sddm')
-        about.set_website_label('GitHub')
-        about.set_authors(['RhythmCreative'])
-        about.set_copyright('Copyright © 2024 RhythmCreative')
-        about.set_license_type(Gtk.License.MIT_X11)
-        
-        # Set icon (if available)
+    if needs_privilege:
+        results = helper.run([('delete', path) for path in needs_privilege])
+        deleted.extend(path for path, ok in zip(needs_privilege, results) if ok)
+    return deleted
+
+ROTATION_POLICIES = ('sequential', 'shuffle', 'weighted')
+ROTATION_PERIODS = ('always', 'boot', 'hourly', 'daily', 'bucket')
+
+def active_rotation_bucket(buckets, now):
+    """Start time ("HH:MM") of the time-of-day bucket that contains now, or None"""
+    if not buckets:
+        return None
+    starts = sorted(buckets)
+    current = now.strftime('%H:%M')
+    # Antes del primer tramo del día sigue activo el último del día anterior
+    return ([start for start in starts if start <= current] or starts)[-1]
+
+def rotation_period_key(period, now, bucket=None):
+    """Identifier of the current rotation period; the background changes when it changes"""
+    if period == 'boot':
         try:
-            about.set_logo_icon_name('preferences-desktop-wallpaper')
-        except:
-            pass
-        
-        about.run()
-        about.destroy()
-        
-    def on_destroy(self, widget):
-        """Handle window close"""
-        self.save_app_settings()
-        Gtk.main_quit()
-
-class SettingsDialog(Gtk.Dialog):
-    def __init__(self, parent):
-        super().__init__(title='Configuración', parent=parent, modal=True)
-        self.set_default_size(400, 300)
-        self.set_resizable(False)
-        
-        self.parent = parent
-        
-        # Add buttons
-        self.add_button('Cancelar', Gtk.ResponseType.CANCEL)
-        self.add_button('Aplicar', Gtk.ResponseType.OK)
-        
-        # Content area
-        content = self.get_content_area()
-        content.set_spacing(12)
-        content.set_margin_top(12)
-        content.set_margin_bottom(12)
-        content.set_margin_start(12)
-        content.set_margin_end(12)
-        
-        # Grid columns setting
-        grid_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
-        grid_label = Gtk.Label('Columnas en la cuadrícula:')
-        grid_label.set_halign(Gtk.Align.START)
-        
-        self.grid_spin = Gtk.SpinButton()
-        self.grid_spin.set_range(2, 8)
-        self.grid_spin.set_increments(1, 1)
-        self.grid_spin.set_value(parent.settings.get('grid_columns', 4))
-        
-        grid_box.pack_start(grid_label, False, False, 0)
-        grid_box.pack_end(self.grid_spin, False, False, 0)
-        content.pack_start(grid_box, False, False, 0)
-        
-        # Preview size setting
-        size_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
-        size_label = Gtk.Label('Tamaño de vista previa:')
-        size_label.set_halign(Gtk.Align.START)
-        
-        self.size_spin = Gtk.SpinButton()
-        self.size_spin.set_range(80, 300)
-        self.size_spin.set_increments(10, 20)
-        self.size_spin.set_value(parent.settings.get('preview_size', 160))
-        
-        size_box.pack_start(size_label, False, False, 0)
-        size_box.pack_end(self.size_spin, False, False, 0)
-        content.pack_start(size_box, False, False, 0)
-        
-        # Theme path setting
-        theme_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
-        theme_label = Gtk.Label('Ruta del tema SDDM:')
-        theme_label.set_halign(Gtk.Align.START)
-        
-        self.theme_entry = Gtk.Entry()
-        self.theme_entry.set_text(parent.theme_path)
-        
-        theme_button = Gtk.Button('Seleccionar...')
-        theme_button.connect('clicked', self.on_select_theme_path)
-        
-        theme_path_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
-        theme_path_box.pack_start(self.theme_entry, True, True, 0)
-        theme_path_box.pack_start(theme_button, False, False, 0)
-        
-        theme_box.pack_start(theme_label, False, False, 0)
-        theme_box.pack_start(theme_path_box, False, False, 0)
-        content.pack_start(theme_box, False, False, 0)
-        
-        self.show_all()
-        
-    def on_select_theme_path(self, button):
-        """Select theme path"""
-        dialog = Gtk.FileChooserDialog(
-            title='Seleccionar directorio del tema',
-            parent=self,
-            action=Gtk.FileChooserAction.SELECT_FOLDER
-        )
-        
-        dialog.add_button('Cancelar', Gtk.ResponseType.CANCEL)
-        dialog.add_button('Seleccionar', Gtk.ResponseType.OK)
+            with open('/proc/sys/kernel/random/boot_id', 'r') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+    if period == 'hourly':
+        return now.strftime('%Y-%m-%d %H')
+    if period == 'daily':
+        return now.strftime('%Y-%m-%d')
+    if period == 'bucket':
+        # Un tramo que cruza la medianoche (p. ej. 20:00-07:00) conserva la fecha en que empezó
+        day = now - timedelta(days=1) if bucket is not None and bucket > now.strftime('%H:%M') else now
+        return f"{day.strftime('%Y-%m-%d')} {bucket}"
+    return None
+
+def pick_next_background(names, current, policy, state, weights=None):
+    """Choose the next background among names; state (a dict) carries the shuffle queue between runs"""
+    import random
+    
+    candidates = [name for name in names if name != current] or list(names)
+    if not candidates:
+        return None
         
-        response = dialog.run()
-        if response == Gtk.ResponseType.OK:
-            path = dialog.get_filename()
-            if path:
-                self.theme_entry.set_text(path)
-                
-        dialog.destroy()
+    if policy == 'sequential':
+        # El siguiente en orden alfabético, volviendo al principio
+        later = [name for name in names if current is None or name > current]
+        return later[0] if later else names[0]
+        
+    if policy == 'shuffle':
+        # Recorrer una permutación completa de todas las imágenes antes de repetir ninguna
+        queue = [name for name in state.get('queue', []) if name in names]
+        if not queue:
+            queue = list(names)
+            random.shuffle(queue)
+            # La imagen actual no puede abrir la ronda nueva: se cambia por otra posterior
+            if len(queue) > 1 and queue[0] == current:
+                swap = random.randrange(1, len(queue))
+                queue[0], queue[swap] = queue[swap], queue[0]
+        choice = queue.pop(0)
+        state['queue'] = queue
+        return choice
+        
+    weights = weights or {}
+    candidate_weights = [max(0.0, float(weights.get(name, 1))) for name in candidates]
+    # Con todos los pesos a 0 no hay preferencia: se elige con la misma probabilidad
+    if not any(candidate_weights):
+        candidate_weights = None
+    return random.choices(candidates, candidate_weights)[0]
+
+def rotate_background(theme_path, policy='shuffle', period='always', settings=None,
+                      state_path=None, now=None, helper=None):
+    """Move a theme to its next background if the rotation period changed
+    
+    Returns the new filename, or None when nothing had to change. Only the
+    core of this module is used: no GTK, palettes or thumbnails.
+    """
+    settings = settings or load_settings()
+    state_path = state_path or os.path.join(CACHE_DIR, 'rotation.json')
+    now = now or datetime.now()
+    backgrounds_path = os.path.join(theme_path, 'Backgrounds')
+    config_path = theme_config_path(theme_path)
+    
+    states = load_json(state_path, {}, 'rotation state')
+    state = states.setdefault(os.path.abspath(theme_path), {})
+    
+    names = list_background_images(backgrounds_path)
+    buckets = settings.get('rotation_buckets') or {}
+    bucket = active_rotation_bucket(buckets, now)
+    if bucket is not None:
+        # Solo las imágenes que encajan con algún patrón del tramo horario actual
+        import fnmatch
+        patterns = buckets[bucket]
+        names = [name for name in names if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)]
+        
+    key = rotation_period_key(period, now, bucket)
+    if key is not None and key == state.get('period'):
+        return None
         
-    def apply_settings(self):
-        """Apply the settings"""
-        self.parent.settings['grid_columns'] = int(self.grid_spin.get_value())
-        self.parent.settings['preview_size'] = int(self.size_spin.get_value())
+    theme_config = ThemeConfig(config_path)
+    filename = pick_next_background(names, theme_config.get_background(), policy, state,
+                                    settings.get('rotation_weights'))
+    if filename is None:
+        return None
         
-        # Update theme path if changed
-        new_theme_path = self.theme_entry.get_text()
-        if new_theme_path != self.parent.theme_path:
-            self.parent.theme_path = new_theme_path
-            self.parent.backgrounds_path = f'{new_theme_path}/Backgrounds'
-            self.parent.config_path = f'{new_theme_path}/Themes/theme1.conf'
-            self.parent.settings['last_used_theme'] = new_theme_path
+    if not write_config_file(config_path, theme_config.render_background(filename),
+                             settings['config_backups'], helper):
+        raise PermissionError(f'Could not write {config_path}')
         
-        # Update flow box
-        self.parent.flow_box.set_max_children_per_line(self.parent.settings['grid_columns'])
+    state['period'] = key
+    state['last'] = filename
+    save_json(state_path, states, 'rotation state')
+    return filename
 
 def main():
     """Main function to run the application"""
+    # Precargar numpy/PIL/sklearn para comparar el arranque con y sin ellas
+    if os.environ.get('BG_SDDM_EAGER_IMPORTS'):
+        load_palette_modules()
+        
+    # GTK solo se importa para la interfaz gráfica; la CLI no lo carga
+    from bg_sddm_gui import Gtk, SDDMBackgroundChanger
+    
     # Initialize GTK
     Gtk.init()
     
     app = SDDMBackgroundChanger()
     return app.run()
 
+def cli_themes(args, settings):
+    """Print the installed themes and their current background"""
+    for theme in discover_themes(args.themes_dir):
+        try:
+            current = ThemeConfig(theme.config_path).get_background() or '-'
+        except OSError:
+            current = '?'
+        print(f"{theme.name}\t{current}\t{theme.config_path}")
+    return 0
+
+def cli_list(args, settings):
+    """Print every background, marking the current one with *"""
+    current = ThemeConfig(args.config).get_background()
+    for name in list_background_images(args.backgrounds):
+        print(f"{'*' if name == current else ' '} {name}")
+    return 0
+
+def cli_current(args, settings):
+    """Print the configured background"""
+    current = ThemeConfig(args.config).get_background()
+    if not current:
+        print("Error: no Background= entry in the theme config", file=sys.stderr)
+        return 1
+    print(current)
+    return 0
+
+def cli_set(args, settings):
+    """Point Background= at an image that is already in the backgrounds directory"""
+    filename = os.path.basename(args.image)
+    if not os.path.isfile(os.path.join(args.backgrounds, filename)):
+        print(f"Error: {filename} is not in {args.backgrounds} (use 'add' first)", file=sys.stderr)
+        return 1
+        
+    if args.all_themes or args.themes:
+        themes = discover_themes(args.themes_dir)
+        missing = set()
+        if not args.all_themes:
+            wanted = {name.strip() for name in args.themes.split(',') if name.strip()}
+            themes = [theme for theme in themes if theme.name in wanted]
+            # Un nombre mal escrito cuenta como fallo aunque los demás temas se actualicen
+            missing = wanted - {theme.name for theme in themes}
+            for name in sorted(missing):
+                print(f"Error: theme {name} not found in {args.themes_dir}", file=sys.stderr)
+        updated = set_background_for_themes(themes, os.path.join(args.backgrounds, filename),
+                                            settings['config_backups'], PrivilegedHelper(keep_alive=False))
+        for theme in themes:
+            print(f"{theme.name}: " + ('background set to ' + filename if theme in updated else 'failed'))
+        return 0 if themes and not missing and len(updated) == len(themes) else 1
+        
+    content = ThemeConfig(args.config).render_background(filename)
+    if not write_config_file(args.config, content, settings['config_backups'], PrivilegedHelper(keep_alive=False)):
+        print(f"Error: could not write {args.config}", file=sys.stderr)
+        return 1
+    print(f"Background set to {filename}")
+    return 0
+
+def cli_add(args, settings):
+    """Import image files and folders with the same pipeline as the GUI"""
+    files, rejected = collect_image_files(args.paths)
+    for path in rejected:
+        print(f"Skipping {path}: not an image", file=sys.stderr)
+        
+    normalization = None
+    if args.normalize:
+        try:
+            width, height = (int(value) for value in args.normalize.lower().split('x'))
+        except ValueError:
+            print(f"Error: invalid resolution '{args.normalize}', expected WIDTHxHEIGHT", file=sys.stderr)
+            return 1
+        normalization = {
+            'max_size': (width, height),
+            'format': settings['normalize_format'],
+            'quality': settings['normalize_quality'],
+            'keep_originals': settings['keep_originals']
+        }
+        
+    copies = import_destinations(files, normalization)
+    if not args.replace:
+        for name in [name for name in copies if os.path.exists(os.path.join(args.backgrounds, name))]:
+            print(f"Skipping {name}: already exists (use --replace)", file=sys.stderr)
+            del copies[name]
+    if not copies:
+        print("No new images to import")
+        return 1 if rejected else 0
+        
+    jobs = [(source, os.path.join(args.backgrounds, name)) for name, source in copies.items()]
+    policy = args.duplicates or settings['duplicate_policy']
+    added, failed, duplicates = import_backgrounds(
+        jobs, args.backgrounds, ContentIndex(), PrivilegedHelper(keep_alive=False),
+        normalization, policy, settings['near_duplicate_distance'],
+        progress_callback=lambda text: print(text, file=sys.stderr)
+    )
+    
+    for source, match, kind in duplicates:
+        action = 'skipped' if policy == 'skip' else 'imported'
+        print(f"Duplicate {action}: {source} = {match}" + (' (similar)' if kind == 'near' else ''))
+    for name in failed:
+        print(f"Error: could not copy {name}", file=sys.stderr)
+    print(f"{added} images added")
+    return 1 if failed or rejected else 0
+
+def cli_remove(args, settings):
+    """Delete backgrounds; the current one is refused"""
+    current = ThemeConfig(args.config).get_background()
+    paths = []
+    for image in args.images:
+        filename = os.path.basename(image)
+        if filename == current:
+            print(f"Error: {filename} is the current background", file=sys.stderr)
+        elif not os.path.isfile(os.path.join(args.backgrounds, filename)):
+            print(f"Error: {filename} is not in {args.backgrounds}", file=sys.stderr)
+        else:
+            paths.append(os.path.join(args.backgrounds, filename))
+            
+    deleted = delete_files(paths, PrivilegedHelper(keep_alive=False)) if paths else []
+    for path in deleted:
+        print(f"Removed {os.path.basename(path)}")
+    return 0 if len(deleted) == len(args.images) else 1
+
+def cli_extract_palette(args, settings):
+    """Print the dominant colors of an image, using and filling the palette index"""
+    image_path = args.image
+    if not os.path.isfile(image_path):
+        image_path = os.path.join(args.backgrounds, args.image)
+    if not os.path.isfile(image_path):
+        print(f"Error: {args.image} not found", file=sys.stderr)
+        return 1
+        
+    palette_index = PaletteIndex()
+    colors = palette_index.get(image_path, args.backend)
+    if not colors:
+        colors = compute_dominant_colors(image_path, args.backend)
+        if not colors:
+            print(f"Error: could not extract colors from {args.image}", file=sys.stderr)
+            return 1
+        palette_index.put(image_path, colors, args.backend)
+    print('\n'.join(colors))
+    return 0
+
+def cli_precompute(args, settings):
+    """Warm the palette index for every background with a process pool"""
+    try:
+        image_paths = [os.path.join(args.backgrounds, name) for name in list_background_images(args.backgrounds)]
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+        
+    def report_progress(done, total, path):
+        print(f"\r[{done}/{total}] {os.path.basename(path)[:60]:<60}", end='', file=sys.stderr, flush=True)
+        
+    start = time.perf_counter()
+    computed, failed = precompute_palettes(image_paths, PaletteIndex(), args.backend,
+                                           max_workers=args.jobs, progress_callback=report_progress)
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+    print(f"{len(image_paths)} images: {computed} computed, {failed} failed, "
+          f"{len(image_paths) - computed - failed} already indexed ({elapsed:.1f}s)")
+    return 1 if failed else 0
+
+def cli_rotate(args, settings):
+    """Switch to the next background once per period; with --daemon, keep checking"""
+    helper = PrivilegedHelper(keep_alive=False)
+    while True:
+        filename = rotate_background(args.theme, args.policy, args.period, settings, helper=helper)
+        if filename:
+            print(f"Background set to {filename}", flush=True)
+        elif not args.daemon:
+            print("Background unchanged for this period")
+            
+        if not args.daemon:
+            return 0
+        time.sleep(args.interval)
+
+def cli_gui(args, settings):
+    """Open the GTK interface; the only command that imports GTK"""
+    if not check_environment():
+        print("Environment check failed. Trying to continue anyway...")
+    return main()
+
+def run_cli(argv):
+    """Headless interface for scripts and SSH sessions: bg_sddm.py [--trace] <comando> [opciones]
+    
+    Only the core of this module is used, so GTK is never imported and no
+    display is needed unless the command is gui. Config writes and imports
+    go through the same functions as the GUI.
+    """
+    import argparse
+    
+    settings = load_settings()
+    backend_default = os.environ.get('BG_SDDM_PALETTE_BACKEND', settings['palette_backend'])
+    
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--theme', default=DEFAULT_THEME_PATH, help='Directorio del tema SDDM')
+    common.add_argument('--backgrounds', default=None, help='Directorio de fondos (por defecto, THEME/Backgrounds)')
+    common.add_argument('--themes-dir', default=SDDM_THEMES_DIR, help='Directorio de temas instalados')
+    # SUPPRESS: el valor de --trace antes del comando no se pisa con el valor por defecto del subcomando
+    common.add_argument('--trace', nargs='?', const='1', default=argparse.SUPPRESS, metavar='ARCHIVO',
+                        help='Medir tiempos (resumen al salir; con ARCHIVO, también traza de Chrome)')
+    
+    parser = argparse.ArgumentParser(prog='bg_sddm.py', description='Gestionar el fondo de SDDM sin interfaz gráfica')
+    parser.add_argument('--trace', nargs='?', const='1', default=None, metavar='ARCHIVO',
+                        help='Medir tiempos (resumen al salir; con ARCHIVO, también traza de Chrome)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    commands.add_parser('gui', help='Abrir la interfaz gráfica (lo mismo que sin argumentos)')
+    commands.add_parser('themes', parents=[common], help='Listar los temas instalados')
+    commands.add_parser('list', parents=[common], help='Listar los fondos (* = actual)')
+    commands.add_parser('current', parents=[common], help='Mostrar el fondo actual')
+    
+    command = commands.add_parser('set', parents=[common], help='Cambiar el fondo')
+    command.add_argument('image', help='Nombre de una imagen del directorio de fondos')
+    command.add_argument('--all-themes', action='store_true', help='Aplicar a todos los temas instalados')
+    command.add_argument('--themes', default=None, metavar='TEMA,TEMA', help='Aplicar a varios temas a la vez')
+    
+    command = commands.add_parser('add', parents=[common], help='Importar imágenes o carpetas')
+    command.add_argument('paths', nargs='+')
+    command.add_argument('--replace', action='store_true', help='Reemplazar las imágenes que ya existen')
+    command.add_argument('--duplicates', choices=DUPLICATE_POLICIES, default=None,
+                         help='Política de duplicados (por defecto, la de la configuración)')
+    command.add_argument('--normalize', metavar='WIDTHxHEIGHT', default=None,
+                         help='Reescalar y recodificar al importar')
+    
+    command = commands.add_parser('remove', parents=[common], help='Eliminar fondos')
+    command.add_argument('images', nargs='+')
+    
+    command = commands.add_parser('extract-palette', parents=[common], help='Mostrar los colores dominantes de una imagen')
+    command.add_argument('image', help='Ruta o nombre de una imagen del directorio de fondos')
+    command.add_argument('--backend', choices=list(PALETTE_BACKENDS), default=backend_default)
+    
+    command = commands.add_parser('precompute', parents=[common], help='Precalcular las paletas de todos los fondos')
+    command.add_argument('--backend', choices=list(PALETTE_BACKENDS), default=backend_default)
+    command.add_argument('--jobs', type=int, default=None, help='Procesos en paralelo (por defecto, todos los núcleos)')
+    
+    command = commands.add_parser('rotate', parents=[common], help='Pasar al siguiente fondo (para temporizadores de systemd)')
+    command.add_argument('--policy', choices=ROTATION_POLICIES, default=settings['rotation_policy'])
+    command.add_argument('--period', choices=ROTATION_PERIODS, default=settings['rotation_period'],
+                         help='Cambiar como mucho una vez por arranque, hora, día o tramo horario')
+    command.add_argument('--daemon', action='store_true', help='Seguir en ejecución comprobando el periodo')
+    command.add_argument('--interval', type=int, default=60, help='Segundos entre comprobaciones con --daemon')
+    
+    # En «--trace list» el comando no es el archivo de la traza
+    argv = list(argv)
+    for index, arg in enumerate(argv):
+        if arg in commands.choices:
+            break
+        if arg == '--trace' and index + 1 < len(argv) and argv[index + 1] in commands.choices:
+            argv[index] = '--trace=1'
+            break
+    args = parser.parse_args(argv)
+    if args.trace:
+        TRACER.enable(None if args.trace == '1' else args.trace)
+    if args.command == 'gui':
+        return cli_gui(args, settings)
+    args.backgrounds = args.backgrounds or os.path.join(args.theme, 'Backgrounds')
+    args.config = theme_config_path(args.theme)
+    
+    handlers = {
+        'themes': cli_themes,
+        'list': cli_list,
+        'current': cli_current,
+        'set': cli_set,
+        'add': cli_add,
+        'remove': cli_remove,
+        'extract-palette': cli_extract_palette,
+        'precompute': cli_precompute,
+        'rotate': cli_rotate
+    }
+    try:
+        return handlers[args.command](args, settings)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
 def check_environment():
     """Check if the environment is suitable for running the GUI application"""
     if os.environ.get('DISPLAY') is None:
@@ -1098,9 +1499,11 @@ def check_environment():
     return True
 
 if __name__ == '__main__':
-    if not check_environment():
-        print("Environment check failed. Trying to continue anyway...")
+    # bg_sddm_gui importa este módulo por su nombre; evitar que se cargue dos veces
+    sys.modules.setdefault('bg_sddm', sys.modules[__name__])
     
-    exit_code = main()
-    sys.exit(exit_code)
-
+    argv = sys.argv[1:]
+    if '--precompute-palettes' in argv:
+        argv = ['precompute'] + [arg for arg in argv if arg != '--precompute-palettes']
+    # Sin argumentos se abre la interfaz gráfica; cualquier otra cosa (también --help) es la CLI
+    sys.exit(run_cli(argv or ['gui']))
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# Benchmarks de bg_sddm sobre directorios de fondos sintéticos, sin necesidad de pantalla.
+#
+#   python3 bg_sddm_bench.py --counts 10,100,1000 --resolutions 1080p,4k,8k --output results.json
+#   python3 bg_sddm_bench.py --baseline results.json     # falla si algún caso es más lento
+#
+# Los casos que necesitan GTK (miniaturas con GdkPixbuf y carga de CSS) solo importan
+# las bibliotecas, nunca abren un display; si no están instaladas se marcan como omitidos.
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import statistics
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from bg_sddm import (
+    PALETTE_BACKENDS, PaletteIndex, ThemeConfig, compute_dominant_colors,
+    list_background_images, load_palette_modules, write_config_file
+)
+
+RESOLUTIONS = {
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160),
+    '8k': (7680, 4320)
+}
+
+def generate_image(path, size, seed):
+    """Write a synthetic wallpaper: a random two-color gradient with a few soft blobs and noise"""
+    import numpy as np
+    from PIL import Image
+    
+    rng = np.random.default_rng(seed)
+    width, height = size
+    start, end = rng.integers(0, 256, (2, 3))
+    ramp = np.linspace(0.0, 1.0, width, dtype=np.float32)[None, :, None]
+    image = np.broadcast_to(start + (end - start) * ramp, (height, width, 3)).copy()
+    
+    # Unas manchas de color para que las paletas y los hashes no sean triviales
+    ys, xs = np.ogrid[:height, :width]
+    for _ in range(4):
+        cx, cy = rng.integers(0, width), rng.integers(0, height)
+        radius = rng.integers(min(size) // 8, min(size) // 3)
+        mask = np.exp(-((xs - cx) ** 2 + (ys - cy) ** 2) / (2.0 * radius ** 2)).astype(np.float32)
+        image += mask[:, :, None] * (rng.integers(0, 256, 3) - image) * 0.8
+    
+    image += rng.normal(0, 6, (height, width, 1)).astype(np.float32)
+    Image.fromarray(np.clip(image, 0, 255).astype(np.uint8)).save(path, 'JPEG', quality=90)
+
+def prepare_dataset(workdir, resolution, count):
+    """Directory with count images at resolution, hard-linked from a per-resolution pool"""
+    pool = os.path.join(workdir, f'pool-{resolution}')
+    dataset = os.path.join(workdir, f'{resolution}-{count}')
+    os.makedirs(pool, exist_ok=True)
+    os.makedirs(dataset, exist_ok=True)
+    
+    for index in range(count):
+        name = f'wallpaper{index:04d}.jpg'
+        source = os.path.join(pool, name)
+        if not os.path.exists(source):
+            generate_image(source, RESOLUTIONS[resolution], seed=index)
+        target = os.path.join(dataset, name)
+        if not os.path.exists(target):
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+    return dataset
+
+def best_of(function, repeat):
+    """Minimum wall time of several runs"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def result(case, seconds, items=1, **params):
+    return dict(case=case, seconds=round(seconds, 6), items=items,
+                per_item_ms=round(seconds * 1000 / max(items, 1), 4), **params)
+
+def bench_grid_scan(dataset, resolution, count, repeat):
+    """Directory diff done by load_backgrounds: listing plus one stat per image"""
+    def scan():
+        for name in list_background_images(dataset):
+            os.stat(os.path.join(dataset, name))
+    return result('grid_scan', best_of(scan, repeat), count, resolution=resolution, count=count)
+
+def bench_thumbnails(dataset, resolution, count, preview_size):
+    """Cold (empty cache) and warm grid loads through ThumbnailCache with the GUI's worker count"""
+    try:
+        from bg_sddm_gui import ThumbnailCache
+    except (ImportError, ValueError) as e:
+        return [dict(case='thumbnails', resolution=resolution, count=count, skipped=str(e))]
+    
+    width, height = preview_size, int(preview_size * 9 / 16)
+    paths = [os.path.join(dataset, name) for name in list_background_images(dataset)]
+    cache_dir = tempfile.mkdtemp(prefix='bg-sddm-bench-thumbs-')
+    # Directorio compartido propio para no tocar ~/.cache/thumbnails
+    shared_dir = os.path.join(cache_dir, 'shared')
+    cache = ThumbnailCache(cache_dir=os.path.join(cache_dir, 'private'), max_size_mb=4096, shared_dir=shared_dir)
+    
+    def load_all():
+        with ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1)) as executor:
+            list(executor.map(lambda path: cache.load_pixbuf(path, width, height), paths))
+    
+    try:
+        cold = best_of(load_all, 1)
+        warm = best_of(load_all, 1)
+        # Caché propia vacía, pero con las miniaturas de la especificación ya escritas
+        cache = ThumbnailCache(cache_dir=os.path.join(cache_dir, 'private-2'), max_size_mb=4096, shared_dir=shared_dir)
+        shared = best_of(load_all, 1)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return [
+        result('thumbnails_cold', cold, count, resolution=resolution, count=count),
+        result('thumbnails_warm', warm, count, resolution=resolution, count=count),
+        result('thumbnails_shared', shared, count, resolution=resolution, count=count)
+    ]
+
+def bench_palettes(dataset, resolution, backends, sample):
+    """Palette extraction per backend on a sample of images, then warm palette index lookups"""
+    paths = [os.path.join(dataset, name) for name in list_background_images(dataset)][:sample]
+    results = []
+    index_path = os.path.join(tempfile.mkdtemp(prefix='bg-sddm-bench-palettes-'), 'palettes.json')
+    # El coste de importar numpy/PIL/sklearn no debe contar en el primer backend
+    load_palette_modules()
+    palette_index = PaletteIndex(index_path)
+    
+    for backend in backends:
+        timings = []
+        for path in paths:
+            start = time.perf_counter()
+            colors = compute_dominant_colors(path, backend)
+            timings.append(time.perf_counter() - start)
+            if colors:
+                palette_index.put(path, colors, backend, save=False)
+        entry = result(f'palette_{backend}', sum(timings), len(paths), resolution=resolution, backend=backend)
+        entry['median_ms'] = round(statistics.median(timings) * 1000, 4) if timings else None
+        results.append(entry)
+    
+    def lookup_all():
+        for path in paths:
+            palette_index.get(path, backends[0])
+    results.append(result('palette_index_hit', best_of(lookup_all, 5), len(paths), resolution=resolution))
+    shutil.rmtree(os.path.dirname(index_path), ignore_errors=True)
+    return results
+
+def bench_css(iterations):
+    """Parse the static stylesheet once and reload the @define-color provider with new palettes"""
+    try:
+        import gi
+        gi.require_version('Gtk', '3.0')
+        from gi.repository import Gtk
+        from bg_sddm_gui import THEME_CSS, THEME_COLOR_KEYS
+    except (ImportError, ValueError) as e:
+        return [dict(case='css', skipped=str(e))]
+    
+    static = best_of(lambda: Gtk.CssProvider().load_from_data(THEME_CSS.encode()), 5)
+    provider = Gtk.CssProvider()
+    rng = random.Random(0)
+    palettes = [{key: '#%06x' % rng.randrange(0x1000000) for key in THEME_COLOR_KEYS} for _ in range(iterations)]
+    
+    def reload_colors():
+        for colors in palettes:
+            css = ''.join(f'@define-color bg_sddm_{key} {value};\n' for key, value in colors.items())
+            provider.load_from_data(css.encode())
+    return [
+        result('css_static_load', static),
+        result('css_palette_reload', best_of(reload_colors, 3), iterations)
+    ]
+
+def bench_config(iterations, keep_backups):
+    """Atomic theme1.conf writes with backup rotation, and cold/warm config reads"""
+    theme_dir = tempfile.mkdtemp(prefix='bg-sddm-bench-theme-')
+    config_path = os.path.join(theme_dir, 'theme1.conf')
+    with open(config_path, 'w') as f:
+        f.write('[General]\n' + ''.join(f'# option {index}\nKey{index}="value"\n' for index in range(60)))
+        f.write('Background="Backgrounds/wallpaper0000.jpg"\n')
+    
+    try:
+        config = ThemeConfig(config_path)
+        cold = best_of(lambda: (config.invalidate(), config.get_background()), 20)
+        warm = best_of(config.get_background, 20)
+        
+        def write_all():
+            for index in range(iterations):
+                write_config_file(config_path, config.render_background(f'wallpaper{index:04d}.jpg'), keep_backups)
+                config.invalidate()
+        writes = best_of(write_all, 1)
+    finally:
+        shutil.rmtree(theme_dir, ignore_errors=True)
+    return [
+        result('config_read_cold', cold),
+        result('config_read_warm', warm),
+        result('config_write', writes, iterations, keep_backups=keep_backups)
+    ]
+
+def result_key(entry):
+    return tuple((name, entry.get(name)) for name in ('case', 'resolution', 'count', 'backend'))
+
+def compare_with_baseline(results, baseline_path, threshold, min_seconds):
+    """Print cases slower than baseline * threshold; returns the number of regressions
+    
+    Cases faster than min_seconds in the baseline are ignored, their timings are mostly noise.
+    """
+    with open(baseline_path, 'r') as f:
+        baseline = {result_key(entry): entry for entry in json.load(f)['results'] if 'seconds' in entry}
+    
+    regressions = 0
+    for entry in results:
+        previous = baseline.get(result_key(entry))
+        if 'seconds' not in entry or not previous or previous['seconds'] < min_seconds:
+            continue
+        ratio = entry['seconds'] / previous['seconds']
+        if ratio > threshold:
+            regressions += 1
+            label = ' '.join(f'{name}={value}' for name, value in result_key(entry) if value is not None)
+            print(f"REGRESSION {label}: {previous['seconds']:.4f}s -> {entry['seconds']:.4f}s ({ratio:.2f}x)",
+                  file=sys.stderr)
+    return regressions
+
+def main(argv=None):
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Benchmarks de bg_sddm con fondos sintéticos')
+    parser.add_argument('--counts', default='10,100', help='Número de imágenes por directorio (p. ej. 10,100,1000)')
+    parser.add_argument('--resolutions', default='1080p,4k', help=f"Resoluciones: {','.join(RESOLUTIONS)}")
+    parser.add_argument('--backends', default=','.join(PALETTE_BACKENDS), help='Backends de paleta a medir')
+    parser.add_argument('--palette-sample', type=int, default=10, help='Imágenes por backend y resolución')
+    parser.add_argument('--preview-size', type=int, default=160)
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones de los casos rápidos (se toma el mínimo)')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'bg-sddm-bench'),
+                        help='Dónde generar (y reutilizar) los directorios sintéticos')
+    parser.add_argument('--output', default=None, help='Archivo JSON de resultados (por defecto, stdout)')
+    parser.add_argument('--baseline', default=None, help='JSON anterior con el que comparar')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Factor de lentitud que cuenta como regresión')
+    parser.add_argument('--min-seconds', type=float, default=0.005, help='Casos más rápidos no se comparan')
+    args = parser.parse_args(argv)
+    
+    counts = sorted(int(value) for value in args.counts.split(','))
+    resolutions = args.resolutions.split(',')
+    backends = args.backends.split(',')
+    for name in resolutions:
+        if name not in RESOLUTIONS:
+            parser.error(f'unknown resolution {name}')
+    for name in backends:
+        if name not in PALETTE_BACKENDS:
+            parser.error(f'unknown backend {name}')
+    
+    results = []
+    for resolution in resolutions:
+        for count in counts:
+            print(f"Preparing {count} images at {resolution}...", file=sys.stderr)
+            dataset = prepare_dataset(args.workdir, resolution, count)
+            results.append(bench_grid_scan(dataset, resolution, count, args.repeat))
+            results.extend(bench_thumbnails(dataset, resolution, count, args.preview_size))
+        # El coste por imagen de la paleta no depende del tamaño del directorio
+        results.extend(bench_palettes(dataset, resolution, backends, args.palette_sample))
+    results.extend(bench_css(100))
+    results.extend(bench_config(50, keep_backups=5))
+    
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'results': results
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    
+    if args.baseline:
+        return 1 if compare_with_baseline(results, args.baseline, args.threshold, args.min_seconds) else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2043 @@
+# Interfaz GTK de bg_sddm; solo se importa al arrancar la aplicación gráfica (ver bg_sddm.main)
+
+import gi
+gi.require_version('Gtk', '3.0')
+gi.require_version('Gdk', '3.0')
+
+from gi.repository import Gtk, GLib, Gio, Gdk, GdkPixbuf, Pango
+import os
+import sys
+import time
+import json
+import colorsys
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bg_sddm import (
+    CACHE_DIR, DEFAULT_PALETTE_BACKEND, DEFAULT_THEME_PATH, DUPLICATE_POLICIES, HEAVY_MODULES, IMAGE_EXTENSIONS,
+    PALETTE_BACKENDS, SETTINGS_FILE, SHARED_THUMBNAILS_DIR, STARTUP_TIME, TRACER, ContentIndex, PaletteIndex, PrivilegedHelper,
+    SDDMTheme, ThemeConfig, collect_image_files, compute_dominant_colors, delete_files, discover_themes,
+    import_backgrounds, import_destinations, list_background_images, load_settings, precompute_palettes,
+    set_background_for_themes, theme_config_path, write_config_file
+)
+
+class ThumbnailCache:
+    """Persistent on-disk cache of grid thumbnails under ~/.cache/bg-sddm/thumbnails"""
+    
+    # Tamaños de la especificación de miniaturas de freedesktop.org (lado mayor en píxeles)
+    SHARED_SIZES = (('normal', 128), ('large', 256), ('x-large', 512), ('xx-large', 1024))
+    # Anchos de los niveles guardados (cadena 1x/2x/4x); la altura sigue la proporción 16:9
+    LEVELS = (160, 320, 640)
+    
+    def __init__(self, cache_dir=None, max_size_mb=128, shared_dir=None):
+        self.cache_dir = cache_dir or os.path.join(CACHE_DIR, 'thumbnails')
+        # Directorio ~/.cache/thumbnails compartido con los gestores de archivos; None lo desactiva
+        self.shared_dir = shared_dir
+        self.max_size = max_size_mb * 1024 * 1024
+        self.total_size = None
+        # Thumbnails are decoded from worker threads
+        self.lock = threading.Lock()
+        
+    def get_cache_path(self, image_path, level):
+        """Return the cache file for one mip level of an image, or None if the image can't be stat'ed"""
+        try:
+            st = os.stat(image_path)
+        except OSError:
+            return None
+            
+        # La clave cambia si el archivo se modifica; el tamaño de vista previa solo elige el nivel
+        key = f'{os.path.abspath(image_path)}|{st.st_size}|{st.st_mtime_ns}|L{level}'
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.png')
+        
+    def level_for(self, width):
+        """Smallest mip level at least width pixels wide (the largest level if none is)"""
+        return next((level for level in self.LEVELS if level >= width), self.LEVELS[-1])
+        
+    def load_pixbuf(self, image_path, width, height):
+        """Load a thumbnail fitting width x height, rescaling a cached mip level when possible"""
+        level = self.level_for(width)
+        
+        # Cualquier nivel igual o mayor sirve: basta con reescalarlo, sin leer el original
+        for candidate in self.LEVELS[self.LEVELS.index(level):]:
+            cache_path = self.get_cache_path(image_path, candidate)
+            if not cache_path or not os.path.exists(cache_path):
+                continue
+            try:
+                with TRACER.span('thumbnail_cached', level=candidate):
+                    pixbuf = GdkPixbuf.Pixbuf.new_from_file(cache_path)
+                # Marcar como usado recientemente para la política de expulsión
+                os.utime(cache_path, None)
+            except Exception as e:
+                print(f"Debug - Discarding unreadable thumbnail {cache_path}: {e}")
+                self.remove(cache_path)
+                continue
+                
+            if candidate != level:
+                # Guardar también el nivel exacto para que la próxima carga sea directa
+                mip = self.fit_pixbuf(pixbuf, level, self.level_height(level))
+                self.store(self.get_cache_path(image_path, level), mip)
+            return self.fit_pixbuf(pixbuf, width, height)
+            
+        # Miniatura ya generada por el gestor de archivos u otra aplicación del escritorio
+        pixbuf = self.load_shared_thumbnail(image_path, width)
+        if pixbuf is not None:
+            return self.fit_pixbuf(pixbuf, width, height)
+            
+        # Sin niveles en caché: decodificar el original una sola vez al doble de tamaño,
+        # así un cambio de escala o de tamaño de vista previa se sirve desde la caché
+        top = self.level_for(width * 2)
+        with TRACER.span('decode', image=os.path.basename(image_path)):
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(image_path, top, self.level_height(top), True)
+        self.store(self.get_cache_path(image_path, top), pixbuf)
+        if level != top:
+            self.store(self.get_cache_path(image_path, level), self.fit_pixbuf(pixbuf, level, self.level_height(level)))
+        self.store_shared_thumbnails(image_path, pixbuf)
+        return self.fit_pixbuf(pixbuf, width, height)
+        
+    def shared_thumbnail_info(self, image_path):
+        """URI, stat result and spec file name (MD5 of the URI) of an image, or None"""
+        try:
+            st = os.stat(image_path)
+        except OSError:
+            return None
+        uri = Gio.File.new_for_path(os.path.abspath(image_path)).get_uri()
+        return uri, st, hashlib.md5(uri.encode('utf-8')).hexdigest() + '.png'
+        
+    def load_shared_thumbnail(self, image_path, width):
+        """Load a valid spec thumbnail at least width pixels on its longest side, or None"""
+        info = self.shared_thumbnail_info(image_path) if self.shared_dir else None
+        if info is None:
+            return None
+            
+        uri, st, name = info
+        for directory, size in self.SHARED_SIZES:
+            if size < width:
+                continue
+            path = os.path.join(self.shared_dir, directory, name)
+            if not os.path.exists(path):
+                continue
+            try:
+                with TRACER.span('thumbnail_shared', size=directory):
+                    pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+            except Exception as e:
+                print(f"Debug - Could not read shared thumbnail {path}: {e}")
+                continue
+                
+            # La miniatura solo es válida si corresponde a este archivo y a su versión actual
+            if pixbuf.get_option('tEXt::Thumb::URI') != uri:
+                continue
+            if pixbuf.get_option('tEXt::Thumb::MTime') != str(int(st.st_mtime)):
+                continue
+            file_size = pixbuf.get_option('tEXt::Thumb::Size')
+            if file_size is not None and file_size != str(st.st_size):
+                continue
+            return pixbuf
+        return None
+        
+    def store_shared_thumbnails(self, image_path, pixbuf):
+        """Write spec thumbnails for every size the decoded pixbuf is large enough for"""
+        info = self.shared_thumbnail_info(image_path) if self.shared_dir else None
+        if info is None:
+            return
+            
+        uri, st, name = info
+        try:
+            _, original_width, original_height = GdkPixbuf.Pixbuf.get_file_info(image_path)
+        except Exception:
+            return
+        if not original_width or not original_height:
+            return
+            
+        keys = ['tEXt::Thumb::URI', 'tEXt::Thumb::MTime', 'tEXt::Thumb::Size', 'tEXt::Software']
+        values = [uri, str(int(st.st_mtime)), str(st.st_size), 'bg-sddm']
+        for directory, size in self.SHARED_SIZES:
+            # Las miniaturas nunca se amplían: el lado mayor es size o el del original si es menor
+            scale = min(1, size / max(original_width, original_height))
+            thumb_width = max(1, round(original_width * scale))
+            thumb_height = max(1, round(original_height * scale))
+            if pixbuf.get_width() < thumb_width or pixbuf.get_height() < thumb_height:
+                break
+                
+            # Se reemplazan también las miniaturas obsoletas de una versión anterior del archivo
+            path = os.path.join(self.shared_dir, directory, name)
+            try:
+                os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+                thumbnail = pixbuf
+                if (pixbuf.get_width(), pixbuf.get_height()) != (thumb_width, thumb_height):
+                    thumbnail = pixbuf.scale_simple(thumb_width, thumb_height, GdkPixbuf.InterpType.BILINEAR)
+                # La especificación pide permisos 600 y escritura atómica; save_png cumple ambas
+                self.save_png(thumbnail, path, keys, values)
+            except Exception as e:
+                print(f"Error saving shared thumbnail: {e}")
+        
+    @staticmethod
+    def level_height(level):
+        """Height of the bounding box of a mip level"""
+        return level * 9 // 16
+        
+    @staticmethod
+    def fit_pixbuf(pixbuf, width, height):
+        """Downscale a pixbuf to fit width x height keeping its aspect ratio"""
+        scale = min(width / pixbuf.get_width(), height / pixbuf.get_height())
+        if scale >= 1:
+            return pixbuf
+        return pixbuf.scale_simple(
+            max(1, round(pixbuf.get_width() * scale)),
+            max(1, round(pixbuf.get_height() * scale)),
+            GdkPixbuf.InterpType.BILINEAR
+        )
+        
+    def store(self, cache_path, pixbuf):
+        """Write a thumbnail atomically and evict old entries if over the size limit"""
+        if not cache_path:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.save_png(pixbuf, cache_path)
+            
+            with self.lock:
+                if self.total_size is None:
+                    self.total_size = self.compute_size()
+                else:
+                    self.total_size += os.path.getsize(cache_path)
+                    
+                if self.total_size > self.max_size:
+                    self.evict()
+        except Exception as e:
+            print(f"Error saving thumbnail: {e}")
+            
+    @staticmethod
+    def save_png(pixbuf, path, keys=(), values=()):
+        """Save a PNG through a private temp file (mode 600) renamed over path
+        
+        Several worker threads can decode the same image at once, so every
+        write gets its own temp file from mkstemp.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        try:
+            pixbuf.savev(tmp_path, 'png', list(keys), list(values))
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+            
+    def remove(self, cache_path):
+        """Remove a single cache entry"""
+        try:
+            os.remove(cache_path)
+        except OSError:
+            pass
+            
+    def compute_size(self):
+        """Total size in bytes of the cache directory"""
+        total = 0
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        total += entry.stat().st_size
+        except OSError:
+            pass
+        return total
+        
+    def evict(self):
+        """Remove least recently used thumbnails until the cache is at 80% of its limit"""
+        try:
+            with os.scandir(self.cache_dir) as it:
+                entries = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in it if e.is_file()]
+        except OSError:
+            return
+            
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_size * 0.8
+        
+        for _, size, path in entries:
+            if total <= target:
+                break
+            self.remove(path)
+            total -= size
+            
+        self.total_size = total
+        print(f"Debug - Thumbnail cache evicted down to {total // 1024} KiB")
+
+# Static application stylesheet; the palette is provided through @define-color
+# (see SDDMBackgroundChanger.apply_dynamic_theme)
+THEME_CSS = """
+/* Main window styling */
+window {
+    background-color: @bg_sddm_primary;
+}
+
+/* Header bar styling */
+headerbar {
+    background: @bg_sddm_secondary;
+    color: white;
+    border-bottom: 1px solid rgba(255,255,255,0.1);
+}
+
+headerbar button {
+    background: rgba(255,255,255,0.1);
+    border: 1px solid rgba(255,255,255,0.2);
+    border-radius: 6px;
+    color: white;
+}
+
+headerbar button:hover {
+    background: rgba(255,255,255,0.2);
+}
+
+/* Main content area */
+.main-content {
+    background: @bg_sddm_secondary;
+    border-radius: 12px;
+    margin: 20px;
+    color: @bg_sddm_text;
+}
+
+/* Image containers */
+.image-container {
+    background: @bg_sddm_secondary;
+    border-radius: 12px;
+    margin: 8px;
+    padding: 12px;
+}
+
+.image-container:hover {
+    background-color: @bg_sddm_accent;
+    background-image: linear-gradient(rgba(255,255,255,0.1), rgba(255,255,255,0.1));
+    box-shadow: 0 4px 12px rgba(0,0,0,0.3);
+}
+
+.image-container.current {
+    border: 3px solid @bg_sddm_accent;
+}
+
+/* Flow box styling */
+flowbox {
+    background: transparent;
+}
+
+flowboxchild {
+    background: transparent;
+    border-radius: 12px;
+    margin: 4px;
+}
+
+flowboxchild:selected {
+    background: rgba(102,126,234,0.1);
+}
+
+/* Status bar */
+.status-bar {
+    background: @bg_sddm_secondary;
+    border-radius: 8px;
+    padding: 8px 12px;
+    color: @bg_sddm_text;
+}
+
+/* Scrolled window */
+scrolledwindow {
+    background: transparent;
+}
+
+/* Text elements */
+label {
+    color: @bg_sddm_text;
+}
+
+.dim-label {
+    color: @bg_sddm_text;
+    opacity: 0.7;
+}
+
+/* Image labels */
+.image-label {
+    color: @bg_sddm_text;
+}
+
+.current-label {
+    color: @bg_sddm_accent;
+    font-weight: bold;
+}
+
+/* Buttons */
+button.add-button {
+    background: @bg_sddm_accent;
+    color: white;
+    border: none;
+    border-radius: 8px;
+    padding: 8px 16px;
+    font-weight: bold;
+}
+
+button.add-button:hover {
+    background: @bg_sddm_accent;
+    opacity: 0.8;
+}
+
+/* Delete button styling */
+.delete-button {
+    background: rgba(255, 71, 87, 0.9);
+    color: white;
+    border: none;
+    border-radius: 12px;
+    padding: 6px;
+    font-size: 14px;
+    font-weight: normal;
+    opacity: 0.0;
+    margin: 4px;
+}
+
+.image-container:hover .delete-button {
+    opacity: 1.0;
+}
+
+.delete-button:hover {
+    background: rgba(255, 71, 87, 0.9);
+    color: white;
+    border: none;
+    opacity: 1.0;
+}
+
+.delete-button:active {
+    background: rgba(255, 55, 66, 1.0);
+    color: white;
+}
+
+/* Drag and drop styling */
+.drop-target {
+    border: 3px dashed @bg_sddm_accent;
+    border-radius: 8px;
+    background-color: rgba(0, 0, 0, 0.1);
+}
+
+.drag-highlight {
+    background-color: rgba(100, 150, 255, 0.2);
+}
+"""
+
+THEME_COLOR_KEYS = ('primary', 'secondary', 'accent', 'text')
+
+class SDDMBackgroundChanger(Gtk.Application):
+    def __init__(self):
+        super().__init__(application_id='com.rhythmcreative.bg-sddm')
+        self.theme_path = DEFAULT_THEME_PATH
+        self.backgrounds_path = f'{self.theme_path}/Backgrounds'
+        self.config_path = theme_config_path(self.theme_path)
+        self.current_theme_colors = {
+            'primary': '#1a1a1a',
+            'secondary': '#2d2d2d', 
+            'accent': '#4CAF50',
+            'text': '#e0e0e0'
+        }
+        self.css_provider = None
+        self.color_css_provider = None
+        self.applied_theme_colors = None
+        self.palette_index = PaletteIndex()
+        self.palette_backend = os.environ.get('BG_SDDM_PALETTE_BACKEND', DEFAULT_PALETTE_BACKEND)
+        self.setup_css()
+        
+    def extract_colors_from_image(self, image_path):
+        """Extract dominant colors from an image, using the palette index when possible"""
+        hex_colors = self.palette_index.get(image_path, self.palette_backend)
+        if hex_colors:
+            print(f"Debug - Palette index hit for {os.path.basename(image_path)}")
+            return self.generate_theme_from_colors(hex_colors)
+            
+        hex_colors = self.compute_dominant_colors(image_path)
+        if not hex_colors:
+            return self.get_default_theme()
+            
+        self.palette_index.put(image_path, hex_colors, self.palette_backend)
+        return self.generate_theme_from_colors(hex_colors)
+        
+    def set_palette_backend(self, backend):
+        """Select the quantizer used for palette extraction"""
+        if backend not in PALETTE_BACKENDS:
+            print(f"Unknown palette backend '{backend}', using {DEFAULT_PALETTE_BACKEND}")
+            backend = DEFAULT_PALETTE_BACKEND
+        self.palette_backend = backend
+        
+    def compute_dominant_colors(self, image_path, n_colors=5):
+        """Quantize an image with the selected backend"""
+        return compute_dominant_colors(image_path, self.palette_backend, n_colors)
+    
+    def generate_theme_from_colors(self, colors):
+        """Generate a theme from extracted colors"""
+        # Get the most dominant color
+        primary_color = colors[0]
+        
+        # Convert to HSL for better color manipulation
+        rgb = tuple(int(primary_color[i:i+2], 16) for i in (1, 3, 5))
+        h, l, s = colorsys.rgb_to_hls(rgb[0]/255, rgb[1]/255, rgb[2]/255)
+        
+        # Generate complementary colors
+        # Dark background
+        dark_l = max(0.05, l * 0.1)  # Very dark version
+        dark_rgb = colorsys.hls_to_rgb(h, dark_l, s)
+        dark_color = '#{:02x}{:02x}{:02x}'.format(
+            int(dark_rgb[0] * 255), int(dark_rgb[1] * 255), int(dark_rgb[2] * 255)
+        )
+        
+        # Medium background  
+        medium_l = max(0.1, l * 0.2)  # Dark version
+        medium_rgb = colorsys.hls_to_rgb(h, medium_l, s)
+        medium_color = '#{:02x}{:02x}{:02x}'.format(
+            int(medium_rgb[0] * 255), int(medium_rgb[1] * 255), int(medium_rgb[2] * 255)
+        )
+        
+        # Accent color (brighter version)
+        accent_l = min(0.7, l * 1.5)
+        accent_rgb = colorsys.hls_to_rgb(h, accent_l, min(1.0, s * 1.2))
+        accent_color = '#{:02x}{:02x}{:02x}'.format(
+            int(accent_rgb[0] * 255), int(accent_rgb[1] * 255), int(accent_rgb[2] * 255)
+        )
+        
+        # Text color (high contrast)
+        text_color = '#e0e0e0' if l < 0.5 else '#2c3e50'
+        
+        return {
+            'primary': dark_color,
+            'secondary': medium_color,
+            'accent': accent_color,
+            'text': text_color,
+            'original': primary_color
+        }
+    
+    def get_default_theme(self):
+        """Get default theme colors"""
+        return {
+            'primary': '#1a1a1a',
+            'secondary': '#2d2d2d', 
+            'accent': '#4CAF50',
+            'text': '#e0e0e0'
+        }
+    
+    def apply_dynamic_theme(self, colors):
+        """Apply dynamic theme based on extracted colors"""
+        theme_colors = {key: colors[key] for key in THEME_COLOR_KEYS}
+        self.current_theme_colors = colors
+        
+        # Misma paleta: no hace falta volver a aplicar estilos a todo el árbol de widgets
+        if self.applied_theme_colors == theme_colors:
+            return
+        self.applied_theme_colors = theme_colors
+        
+        # Solo se recarga el pequeño proveedor de colores; las reglas estáticas no cambian
+        with TRACER.span('css'):
+            css = ''.join(f'@define-color bg_sddm_{key} {value};\n' for key, value in theme_colors.items())
+            self.color_css_provider.load_from_data(css.encode())
+    
+    def setup_css(self):
+        """Setup initial CSS styling for the application"""
+        screen = Gdk.Screen.get_default()
+        
+        # Colores primero, para que las reglas estáticas puedan resolverlos
+        self.color_css_provider = Gtk.CssProvider()
+        Gtk.StyleContext.add_provider_for_screen(screen, self.color_css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+        
+        # Las reglas estáticas se cargan una sola vez
+        self.css_provider = Gtk.CssProvider()
+        self.css_provider.load_from_data(THEME_CSS.encode())
+        Gtk.StyleContext.add_provider_for_screen(screen, self.css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+        
+        # Apply default theme initially
+        self.apply_dynamic_theme(self.current_theme_colors)
+        
+    def do_activate(self):
+        self.win = SDDMWindow(application=self)
+        if os.environ.get('BG_SDDM_STARTUP_PROFILE'):
+            self.win.connect('draw', self.on_first_draw)
+        self.win.show_all()
+        
+    def on_first_draw(self, widget, cr):
+        """Report time to first window paint (BG_SDDM_STARTUP_PROFILE=1)"""
+        widget.disconnect_by_func(self.on_first_draw)
+        elapsed_ms = (time.perf_counter() - STARTUP_TIME) * 1000
+        loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+        print(f"Startup - first window paint after {elapsed_ms:.0f} ms "
+              f"(heavy modules loaded: {', '.join(loaded) or 'none'})")
+        return False
+
+class SDDMWindow(Gtk.ApplicationWindow):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.set_title('SDDM Background Changer')
+        self.set_default_size(900, 700)
+        self.set_resizable(True)
+        self.set_position(Gtk.WindowPosition.CENTER)
+        
+        # Configuration and settings
+        self.config_file = SETTINGS_FILE
+        self.load_app_settings()
+        
+        # Volver al último tema usado si sigue instalado
+        last_theme = self.settings['last_used_theme']
+        self.set_theme_paths(last_theme if os.path.isdir(last_theme) else DEFAULT_THEME_PATH)
+        self.themes = []
+        # Grids de los demás temas abiertos en la sesión, para cambiar de tema al instante
+        self.theme_views = {}
+        self.thumbnail_cache = ThumbnailCache(
+            max_size_mb=self.settings['thumbnail_cache_mb'],
+            shared_dir=SHARED_THUMBNAILS_DIR if self.settings['shared_thumbnails'] else None
+        )
+        
+        # Operaciones con permisos por lotes a través de bg-sddm-helper; el proceso solo
+        # sigue abierto entre lotes si keep_privileged_helper está activado
+        self.privileged_helper = PrivilegedHelper(keep_alive=self.settings['keep_privileged_helper'])
+        self.content_index = ContentIndex()
+        
+        # La variable de entorno tiene prioridad sobre la configuración guardada
+        self.get_application().set_palette_backend(
+            os.environ.get('BG_SDDM_PALETTE_BACKEND', self.settings['palette_backend'])
+        )
+        
+        # Decodificación de miniaturas fuera del hilo principal
+        self.thumbnail_executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+        
+        # Extracción de paletas en un único hilo; solo cuenta la última petición
+        self.palette_executor = ThreadPoolExecutor(max_workers=1)
+        self.palette_future = None
+        self.palette_request_id = 0
+        self.precompute_cancel = threading.Event()
+        self.import_in_progress = False
+        
+        # Vigilancia del directorio de fondos y de theme1.conf
+        self.file_monitors = []
+        self.pending_fs_changes = set()
+        self.pending_config_change = False
+        self.fs_flush_source = None
+        
+        # Tiles del grid indexados por nombre de archivo
+        self.tiles = {}
+        self.current_background = None
+        self.visible_update_pending = False
+        self.connect('destroy', self.on_window_destroyed)
+        # Al mover la ventana a un monitor con otra escala se regeneran las miniaturas
+        self.connect('notify::scale-factor', self.apply_preview_size)
+        
+        self.setup_ui()
+        
+        # Pintar ya con la última paleta conocida; el grid y la paleta actual llegan tras el primer frame
+        self.apply_initial_theme()
+        self.connect('draw', self.on_startup_draw)
+        
+    def set_theme_paths(self, theme_path):
+        """Point the window at a theme directory"""
+        self.theme_path = os.path.normpath(theme_path)
+        self.backgrounds_path = f'{self.theme_path}/Backgrounds'
+        self.config_path = theme_config_path(self.theme_path)
+        self.theme_config = ThemeConfig(self.config_path)
+        
+    def load_app_settings(self):
+        """Load application settings from config file"""
+        self.settings = load_settings(self.config_file)
+        
+    def save_app_settings(self):
+        """Save application settings to config file"""
+        try:
+            # Update current window size
+            width, height = self.get_size()
+            self.settings['window_width'] = width
+            self.settings['window_height'] = height
+            
+            config_dir = os.path.dirname(self.config_file)
+            if not os.path.exists(config_dir):
+                os.makedirs(config_dir, exist_ok=True)
+                
+            with open(self.config_file, 'w') as f:
+                json.dump(self.settings, f, indent=2)
+                
+        except Exception as e:
+            print(f"Error saving settings: {e}")
+            
+    def apply_initial_theme(self):
+        """Apply the palette saved by the last session; no image is read before the first paint"""
+        last_palette = self.settings.get('last_palette')
+        if last_palette and all(key in last_palette for key in THEME_COLOR_KEYS):
+            self.get_application().apply_dynamic_theme(last_palette)
+            
+    def on_startup_draw(self, widget, cr):
+        """Defer the rest of the startup work until the first frame is on screen"""
+        self.disconnect_by_func(self.on_startup_draw)
+        GLib.idle_add(self.finish_startup)
+        return False
+        
+    def finish_startup(self):
+        """Fill the grid and extract the current background's palette in the background"""
+        with TRACER.span('startup_grid'):
+            self.load_backgrounds()
+            self.setup_file_monitors()
+            
+        if self.current_background:
+            self.request_theme_for_image(self.current_background)
+            
+        if os.environ.get('BG_SDDM_STARTUP_PROFILE'):
+            elapsed_ms = (time.perf_counter() - STARTUP_TIME) * 1000
+            print(f"Startup - grid populated after {elapsed_ms:.0f} ms")
+        return False
+        
+    def setup_ui(self):
+        # Header bar
+        header_bar = Gtk.HeaderBar()
+        header_bar.set_show_close_button(True)
+        header_bar.set_title('SDDM Background Changer')
+        self.set_titlebar(header_bar)
+        
+        # Add image button
+        add_button = Gtk.Button()
+        add_button.set_image(Gtk.Image.new_from_icon_name('list-add-symbolic', Gtk.IconSize.BUTTON))
+        add_button.set_tooltip_text('Añadir nueva imagen')
+        add_button.connect('clicked', self.on_add_image_clicked)
+        header_bar.pack_start(add_button)
+        
+        # Import folder button
+        import_button = Gtk.Button()
+        import_button.set_image(Gtk.Image.new_from_icon_name('folder-open-symbolic', Gtk.IconSize.BUTTON))
+        import_button.set_tooltip_text('Importar carpeta de imágenes')
+        import_button.connect('clicked', self.on_import_folder_clicked)
+        header_bar.pack_start(import_button)
+        
+        # Refresh button
+        refresh_button = Gtk.Button()
+        refresh_button.set_image(Gtk.Image.new_from_icon_name('view-refresh-symbolic', Gtk.IconSize.BUTTON))
+        refresh_button.set_tooltip_text('Actualizar lista')
+        refresh_button.connect('clicked', self.on_refresh_clicked)
+        header_bar.pack_start(refresh_button)
+        
+        # Precompute palettes button
+        self.precompute_button = Gtk.Button()
+        self.precompute_button.set_image(Gtk.Image.new_from_icon_name('color-select-symbolic', Gtk.IconSize.BUTTON))
+        self.precompute_button.set_tooltip_text('Precalcular colores de todos los fondos')
+        self.precompute_button.connect('clicked', self.on_precompute_clicked)
+        header_bar.pack_start(self.precompute_button)
+        
+        # Find duplicates button
+        duplicates_button = Gtk.Button()
+        duplicates_button.set_image(Gtk.Image.new_from_icon_name('edit-find-symbolic', Gtk.IconSize.BUTTON))
+        duplicates_button.set_tooltip_text('Buscar imágenes duplicadas')
+        duplicates_button.connect('clicked', self.on_find_duplicates_clicked)
+        header_bar.pack_start(duplicates_button)
+        
+        # Apply to every installed theme
+        self.all_themes_check = Gtk.CheckButton(label='Todos los temas')
+        self.all_themes_check.set_tooltip_text('Cambiar el fondo de todos los temas instalados a la vez')
+        
+        # Theme selector
+        self.theme_combo = Gtk.ComboBoxText()
+        self.theme_combo.set_tooltip_text('Tema de SDDM')
+        self.populate_theme_combo()
+        self.theme_combo.connect('changed', self.on_theme_combo_changed)
+        
+        # Settings button
+        settings_button = Gtk.Button()
+        settings_button.set_image(Gtk.Image.new_from_icon_name('preferences-system-symbolic', Gtk.IconSize.BUTTON))
+        settings_button.set_tooltip_text('Configuración')
+        settings_button.connect('clicked', self.on_settings_clicked)
+        header_bar.pack_end(settings_button)
+        
+        # About button
+        about_button = Gtk.Button()
+        about_button.set_image(Gtk.Image.new_from_icon_name('help-about-symbolic', Gtk.IconSize.BUTTON))
+        about_button.set_tooltip_text('Acerca de')
+        about_button.connect('clicked', self.on_about_clicked)
+        header_bar.pack_end(about_button)
+        header_bar.pack_end(self.theme_combo)
+        header_bar.pack_end(self.all_themes_check)
+        
+        # Main content
+        main_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=12)
+        main_box.set_margin_top(12)
+        main_box.set_margin_bottom(12)
+        main_box.set_margin_start(12)
+        main_box.set_margin_end(12)
+        
+        # Title and description
+        title_label = Gtk.Label()
+        title_label.set_markup('<span size="large" weight="bold">Cambiar Background de SDDM</span>')
+        title_label.set_halign(Gtk.Align.START)
+        main_box.pack_start(title_label, False, False, 0)
+        
+        desc_label = Gtk.Label()
+        desc_label.set_text('Selecciona una imagen para cambiar el fondo de la pantalla de login')
+        desc_label.set_halign(Gtk.Align.START)
+        style_context = desc_label.get_style_context()
+        style_context.add_class('dim-label')
+        main_box.pack_start(desc_label, False, False, 0)
+        
+        # Scrolled window for image grid
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        scrolled.set_vexpand(True)
+        self.scrolled_window = scrolled
+        
+        # Recalcular los tiles visibles al desplazarse o redimensionar
+        vadjustment = scrolled.get_vadjustment()
+        vadjustment.connect('value-changed', self.schedule_visible_tiles_update)
+        vadjustment.connect('changed', self.schedule_visible_tiles_update)
+        
+        # Flow box for images
+        scrolled.add(self.create_flow_box())
+        main_box.pack_start(scrolled, True, True, 0)
+        
+        # Status bar
+        status_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        self.status_label = Gtk.Label()
+        self.status_label.set_text('Listo')
+        self.status_label.set_halign(Gtk.Align.START)
+        style_context = self.status_label.get_style_context()
+        style_context.add_class('dim-label')
+        status_box.pack_start(self.status_label, True, True, 0)
+        
+        # Últimos tiempos medidos, solo con BG_SDDM_TRACE
+        self.timing_label = Gtk.Label()
+        self.timing_label.set_halign(Gtk.Align.END)
+        self.timing_label.get_style_context().add_class('dim-label')
+        status_box.pack_end(self.timing_label, False, False, 0)
+        if TRACER.enabled:
+            GLib.timeout_add_seconds(1, self.update_timing_label)
+            
+        main_box.pack_start(status_box, False, False, 0)
+        
+        self.add(main_box)
+        
+    def create_flow_box(self):
+        """Create an empty image grid; each theme keeps its own while the app runs"""
+        self.flow_box = Gtk.FlowBox()
+        self.flow_box.set_valign(Gtk.Align.START)
+        self.flow_box.set_max_children_per_line(self.settings['grid_columns'])
+        self.flow_box.set_selection_mode(Gtk.SelectionMode.SINGLE)
+        self.flow_box.set_sort_func(self.sort_grid_tiles)
+        self.flow_box.connect('child-activated', self.on_image_selected)
+        self.flow_box.connect('size-allocate', self.schedule_visible_tiles_update)
+        
+        # Setup drag and drop for the flow_box
+        self.setup_drag_and_drop()
+        return self.flow_box
+        
+    def populate_theme_combo(self):
+        """Fill the theme selector with the installed themes plus the current one"""
+        self.themes = discover_themes()
+        if self.theme_path not in [theme.path for theme in self.themes]:
+            self.themes.append(SDDMTheme(self.theme_path))
+            
+        self.theme_combo.remove_all()
+        for theme in self.themes:
+            self.theme_combo.append(theme.path, theme.name)
+        self.theme_combo.set_active_id(self.theme_path)
+        
+    def on_theme_combo_changed(self, combo):
+        """Switch to the theme picked in the header"""
+        theme_path = combo.get_active_id()
+        if theme_path and theme_path != self.theme_path:
+            self.switch_theme(theme_path)
+            self.save_app_settings()
+            
+    def switch_theme(self, theme_path):
+        """Show another theme, reusing its grid if it was already opened this session"""
+        theme_path = os.path.normpath(theme_path)
+        if theme_path == self.theme_path:
+            return
+            
+        # Guardar el grid del tema actual tal cual, con sus miniaturas; las que aún se
+        # estaban decodificando se vuelven a pedir al recuperarlo (apply_preview_size)
+        self.cancel_pending_thumbnails()
+        self.theme_views[self.theme_path] = (self.flow_box, self.tiles, self.current_background, self.theme_config)
+        viewport = self.flow_box.get_parent()
+        viewport.remove(self.flow_box)
+        
+        self.set_theme_paths(theme_path)
+        self.settings['last_used_theme'] = self.theme_path
+        view = self.theme_views.pop(self.theme_path, None)
+        if view:
+            self.flow_box, self.tiles, self.current_background, self.theme_config = view
+            self.flow_box.set_max_children_per_line(self.settings['grid_columns'])
+            self.apply_preview_size()
+        else:
+            self.create_flow_box()
+            self.tiles = {}
+            self.current_background = None
+        viewport.add(self.flow_box)
+        
+        # Solo se comparan nombres y fechas; lo que no cambió no se vuelve a decodificar
+        self.load_backgrounds()
+        self.setup_file_monitors()
+        self.schedule_visible_tiles_update()
+        
+        if self.theme_combo.get_active_id() != self.theme_path:
+            if self.theme_path not in [theme.path for theme in self.themes]:
+                self.populate_theme_combo()
+            else:
+                self.theme_combo.set_active_id(self.theme_path)
+                
+        # La paleta de cada fondo ya está en el índice en memoria
+        if self.current_background:
+            self.request_theme_for_image(self.current_background)
+            
+    def update_timing_label(self):
+        """Show the latest duration of each traced hot path in the status bar"""
+        parts = []
+        for name, label in (('scan', 'escaneo'), ('decode', 'decodificación'), ('palette', 'paleta'),
+                            ('css', 'CSS'), ('config_write', 'escritura')):
+            duration = TRACER.last_ms(name)
+            if duration is not None:
+                parts.append(f'{label} {duration:.1f} ms')
+        self.timing_label.set_text(' · '.join(parts))
+        return True
+        
+    def load_backgrounds(self):
+        """Sincronizar el grid con el directorio de backgrounds"""
+        try:
+            if not os.path.exists(self.backgrounds_path):
+                self.show_error_dialog('No se encontró el directorio de backgrounds')
+                return
+                
+            # Obtener fondo actual
+            current_bg = self.get_current_background()
+            
+            # Cargar imágenes
+            image_files = {}
+            with TRACER.span('scan', path=self.backgrounds_path):
+                with os.scandir(self.backgrounds_path) as entries:
+                    for entry in entries:
+                        if entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                            image_files[entry.name] = entry.stat().st_mtime_ns
+                            
+            print(f"Debug - Found {len(image_files)} image files, current background: {current_bg}")
+            
+            # Quitar solo las imágenes que ya no existen
+            for filename in list(self.tiles):
+                if filename not in image_files:
+                    self.remove_image_from_grid(filename)
+                    
+            # Añadir las nuevas y refrescar las que han cambiado en disco
+            for filename, mtime in image_files.items():
+                tile = self.tiles.get(filename)
+                if tile is None:
+                    self.add_image_to_grid(filename, filename == self.current_background)
+                elif tile.mtime != mtime:
+                    self.refresh_image_in_grid(filename)
+                    
+            self.set_current_in_grid(current_bg)
+            
+            # Asegurar que el flow_box se muestre
+            self.flow_box.show_all()
+                
+            status_text = f'Cargadas {len(image_files)} imágenes'
+            if current_bg:
+                status_text += f' - Actual: {current_bg}'
+            self.status_label.set_text(status_text)
+            
+        except Exception as e:
+            error_msg = f'Error al cargar imágenes: {str(e)}'
+            print(f"Debug - {error_msg}")
+            self.show_error_dialog(error_msg)
+            
+    def setup_file_monitors(self):
+        """Watch the backgrounds directory and theme1.conf for external changes"""
+        self.cancel_file_monitors()
+        try:
+            backgrounds_monitor = Gio.File.new_for_path(self.backgrounds_path).monitor_directory(
+                Gio.FileMonitorFlags.WATCH_MOVES, None
+            )
+            backgrounds_monitor.connect('changed', self.on_backgrounds_changed)
+            self.file_monitors.append(backgrounds_monitor)
+            
+            config_monitor = Gio.File.new_for_path(self.config_path).monitor_file(Gio.FileMonitorFlags.NONE, None)
+            config_monitor.connect('changed', self.on_config_file_changed)
+            self.file_monitors.append(config_monitor)
+        except Exception as e:
+            print(f"Error setting up file monitors: {e}")
+            
+    def cancel_file_monitors(self):
+        """Stop watching the previous theme's files"""
+        for monitor in self.file_monitors:
+            monitor.cancel()
+        self.file_monitors = []
+        self.pending_fs_changes.clear()
+        self.pending_config_change = False
+        if self.fs_flush_source:
+            GLib.source_remove(self.fs_flush_source)
+            self.fs_flush_source = None
+            
+    def on_backgrounds_changed(self, monitor, file, other_file, event_type):
+        """Queue a changed filename; the grid is updated once the burst of events settles"""
+        # CHANGED llega varias veces durante una copia; se espera a CHANGES_DONE_HINT
+        if event_type in (Gio.FileMonitorEvent.CHANGED, Gio.FileMonitorEvent.ATTRIBUTE_CHANGED):
+            return
+            
+        for changed in (file, other_file):
+            if changed is not None and changed.get_basename().lower().endswith(IMAGE_EXTENSIONS):
+                self.pending_fs_changes.add(changed.get_basename())
+        self.schedule_fs_flush()
+        
+    def on_config_file_changed(self, monitor, file, other_file, event_type):
+        """Queue a re-read of theme1.conf"""
+        if event_type in (Gio.FileMonitorEvent.CHANGES_DONE_HINT, Gio.FileMonitorEvent.CREATED,
+                          Gio.FileMonitorEvent.DELETED):
+            self.pending_config_change = True
+            self.schedule_fs_flush()
+            
+    def schedule_fs_flush(self):
+        """Coalesce file system events so a bulk copy causes one grid update per interval"""
+        if self.fs_flush_source is None:
+            self.fs_flush_source = GLib.timeout_add(300, self.flush_fs_changes)
+            
+    def flush_fs_changes(self):
+        """Apply the queued file system changes incrementally"""
+        self.fs_flush_source = None
+        changes, self.pending_fs_changes = self.pending_fs_changes, set()
+        
+        for filename in sorted(changes):
+            try:
+                mtime = os.stat(os.path.join(self.backgrounds_path, filename)).st_mtime_ns
+            except OSError:
+                self.remove_image_from_grid(filename)
+                continue
+                
+            tile = self.tiles.get(filename)
+            if tile is None or tile.mtime != mtime:
+                self.refresh_image_in_grid(filename)
+                
+        if self.pending_config_change:
+            self.pending_config_change = False
+            current_bg = self.get_current_background()
+            if current_bg != self.current_background:
+                print(f"Debug - theme1.conf changed externally, current background: {current_bg}")
+                self.set_current_in_grid(current_bg)
+                if current_bg:
+                    self.request_theme_for_image(current_bg)
+                    
+        if changes:
+            self.status_label.set_text(f'{len(self.tiles)} imágenes - cambios detectados en el directorio')
+        return False
+        
+    def sort_grid_tiles(self, child_a, child_b):
+        """Keep the grid sorted by filename so tiles can be inserted in place"""
+        name_a = child_a.get_child().filename
+        name_b = child_b.get_child().filename
+        return (name_a > name_b) - (name_a < name_b)
+    
+    def setup_drag_and_drop(self):
+        """Setup drag and drop functionality"""
+        # Set up the flow_box as a drop target
+        self.flow_box.drag_dest_set(
+            Gtk.DestDefaults.ALL,
+            [],
+            Gdk.DragAction.COPY
+        )
+        
+        # Add target for files
+        target_list = Gtk.TargetList.new([])
+        target_list.add_uri_targets(0)
+        target_list.add_text_targets(1)
+        self.flow_box.drag_dest_set_target_list(target_list)
+        
+        # Connect drag and drop signals
+        self.flow_box.connect('drag-data-received', self.on_drag_data_received)
+        self.flow_box.connect('drag-motion', self.on_drag_motion)
+        self.flow_box.connect('drag-leave', self.on_drag_leave)
+        
+    def on_drag_motion(self, widget, drag_context, x, y, time):
+        """Handle drag motion over the widget"""
+        # Add visual feedback
+        style_context = widget.get_style_context()
+        style_context.add_class('drag-highlight')
+        
+        # Accept the drag
+        Gdk.drag_status(drag_context, Gdk.DragAction.COPY, time)
+        return True
+        
+    def on_drag_leave(self, widget, drag_context, time):
+        """Handle drag leave"""
+        # Remove visual feedback
+        style_context = widget.get_style_context()
+        style_context.remove_class('drag-highlight')
+        
+    def on_drag_data_received(self, widget, drag_context, x, y, data, info, time):
+        """Handle dropped data"""
+        # Remove visual feedback
+        style_context = widget.get_style_context()
+        style_context.remove_class('drag-highlight')
+        
+        # Get the dropped data
+        uris = data.get_uris()
+        
+        if uris:
+            # Convert URIs to local paths and import them as a single batch
+            self.import_images([GLib.filename_from_uri(uri)[0] for uri in uris])
+        
+        # Finish the drag
+        Gtk.drag_finish(drag_context, True, False, time)
+        
+    def import_images(self, source_paths):
+        """Import many files and/or directories into the backgrounds folder in one batch"""
+        if self.import_in_progress:
+            self.status_label.set_text('Ya hay una importación en curso')
+            return
+            
+        files, rejected = collect_image_files(source_paths)
+        if rejected:
+            names = '\n'.join(os.path.basename(path) for path in rejected[:10])
+            if len(rejected) > 10:
+                names += f'\n... y {len(rejected) - 10} más'
+            self.show_error_dialog(f'Archivos no válidos:\n{names}\nSolo se permiten imágenes.')
+        if not files:
+            return
+            
+        normalization = self.get_import_normalization()
+        
+        copies = import_destinations(files, normalization)
+            
+        # Una sola decisión para todos los conflictos
+        conflicts = [name for name in copies if os.path.exists(os.path.join(self.backgrounds_path, name))]
+        if conflicts:
+            decision = self.ask_conflict_resolution(conflicts)
+            if decision == Gtk.ResponseType.CANCEL:
+                return
+            if decision == Gtk.ResponseType.NO:
+                for name in conflicts:
+                    del copies[name]
+            if not copies:
+                self.status_label.set_text('No hay imágenes nuevas que importar')
+                return
+                
+        jobs = [(source, os.path.join(self.backgrounds_path, name)) for name, source in copies.items()]
+        self.import_in_progress = True
+        self.status_label.set_text(f'Importando {len(jobs)} imágenes...')
+        threading.Thread(target=self.run_import, args=(jobs, normalization), daemon=True).start()
+        
+    def get_import_normalization(self):
+        """Normalization options for imports, or None if disabled"""
+        if not self.settings['normalize_on_import']:
+            return None
+            
+        max_size = None
+        resolution = self.settings['normalize_resolution']
+        if resolution:
+            try:
+                width, height = (int(value) for value in resolution.lower().split('x'))
+                max_size = (width, height)
+            except ValueError:
+                print(f"Invalid normalize_resolution '{resolution}', using the monitor size")
+        if max_size is None:
+            # Resolución física del monitor principal
+            display = Gdk.Display.get_default()
+            monitor = display.get_primary_monitor() or display.get_monitor(0)
+            geometry = monitor.get_geometry()
+            scale = monitor.get_scale_factor()
+            max_size = (geometry.width * scale, geometry.height * scale)
+            
+        return {
+            'max_size': max_size,
+            'format': self.settings['normalize_format'],
+            'quality': self.settings['normalize_quality'],
+            'keep_originals': self.settings['keep_originals']
+        }
+        
+    def ask_conflict_resolution(self, conflicts):
+        """Ask once what to do with every image that already exists"""
+        dialog = Gtk.MessageDialog(
+            transient_for=self,
+            modal=True,
+            message_type=Gtk.MessageType.QUESTION,
+            buttons=Gtk.ButtonsType.NONE,
+            text=f'{len(conflicts)} imágenes ya existen en el directorio de fondos.'
+        )
+        preview = ', '.join(conflicts[:5]) + ('...' if len(conflicts) > 5 else '')
+        dialog.format_secondary_text(f'{preview}\n¿Deseas reemplazarlas?')
+        dialog.add_button('Cancelar', Gtk.ResponseType.CANCEL)
+        dialog.add_button('Omitir existentes', Gtk.ResponseType.NO)
+        dialog.add_button('Reemplazar todas', Gtk.ResponseType.YES)
+        response = dialog.run()
+        dialog.destroy()
+        
+        if response == Gtk.ResponseType.DELETE_EVENT:
+            return Gtk.ResponseType.CANCEL
+        return response
+        
+    def run_import(self, jobs, normalization=None):
+        """Run the import pipeline in a worker thread and report back on the main loop"""
+        policy = self.settings['duplicate_policy']
+        added, failed, duplicates = import_backgrounds(
+            jobs, self.backgrounds_path, self.content_index, self.privileged_helper,
+            normalization, policy, self.settings['near_duplicate_distance'],
+            progress_callback=lambda text: GLib.idle_add(self.status_label.set_text, text)
+        )
+        GLib.idle_add(self.on_import_finished, added, failed, duplicates, policy == 'skip')
+        
+    def on_import_finished(self, added, failed, duplicates=(), skipped_duplicates=False):
+        """Refresh the grid once after an import and report the result"""
+        self.import_in_progress = False
+        self.load_backgrounds()
+        status_text = f'Imágenes añadidas: {added}'
+        if duplicates:
+            status_text += f' - {len(duplicates)} duplicadas' + (' omitidas' if skipped_duplicates else '')
+        if failed:
+            status_text += f' - {len(failed)} con errores'
+        self.status_label.set_text(status_text)
+        
+        if duplicates:
+            lines = [f'{source} = {match}' + (' (similar)' if kind == 'near' else '')
+                     for source, match, kind in duplicates[:10]]
+            if len(duplicates) > 10:
+                lines.append(f'... y {len(duplicates) - 10} más')
+            title = 'Se omitieron imágenes duplicadas:' if skipped_duplicates else 'Se importaron posibles duplicados:'
+            self.show_success_dialog(title + '\n' + '\n'.join(lines))
+        if failed:
+            names = '\n'.join(failed[:10]) + (f'\n... y {len(failed) - 10} más' if len(failed) > 10 else '')
+            self.show_error_dialog(f'No se pudieron copiar:\n{names}')
+        return False
+        
+    def on_find_duplicates_clicked(self, button):
+        """Buscar duplicados en el directorio de fondos"""
+        button.set_sensitive(False)
+        self.status_label.set_text('Buscando imágenes duplicadas...')
+        max_distance = self.settings['near_duplicate_distance']
+        
+        def run():
+            try:
+                records = self.content_index.refresh(self.backgrounds_path, use_phash=max_distance > 0)
+                self.content_index.save()
+                groups = self.content_index.find_duplicate_groups(records, max_distance)
+                GLib.idle_add(self.on_duplicates_found, button, groups, None)
+            except Exception as e:
+                GLib.idle_add(self.on_duplicates_found, button, [], str(e))
+                
+        threading.Thread(target=run, daemon=True).start()
+        
+    def on_duplicates_found(self, button, groups, error):
+        """Show duplicate groups and offer to delete every copy but one"""
+        button.set_sensitive(True)
+        if error:
+            self.status_label.set_text('Listo')
+            self.show_error_dialog(f'Error al buscar duplicados: {error}')
+            return False
+        if not groups:
+            self.status_label.set_text('No se encontraron imágenes duplicadas')
+            return False
+            
+        # Se conserva el fondo actual o, si no está en el grupo, el primero por nombre
+        to_delete = []
+        lines = []
+        for group in groups:
+            names = [os.path.basename(path) for path in group]
+            keep = self.current_background if self.current_background in names else names[0]
+            to_delete.extend(name for name in names if name != keep)
+            if len(lines) < 10:
+                lines.append(f'{keep}: ' + ', '.join(name for name in names if name != keep))
+        if len(groups) > 10:
+            lines.append(f'... y {len(groups) - 10} grupos más')
+        self.status_label.set_text(f'{len(groups)} grupos de duplicados, {len(to_delete)} imágenes sobrantes')
+        
+        dialog = Gtk.MessageDialog(
+            transient_for=self,
+            modal=True,
+            message_type=Gtk.MessageType.QUESTION,
+            buttons=Gtk.ButtonsType.NONE,
+            text=f'Se encontraron {len(to_delete)} imágenes duplicadas.'
+        )
+        dialog.format_secondary_text('\n'.join(lines))
+        dialog.add_button('Cancelar', Gtk.ResponseType.CANCEL)
+        dialog.add_button('Eliminar duplicados', Gtk.ResponseType.YES)
+        response = dialog.run()
+        dialog.destroy()
+        
+        if response == Gtk.ResponseType.YES:
+            self.delete_background_images(to_delete)
+        return False
+        
+    def delete_background_images(self, filenames):
+        """Delete several backgrounds, elevating the ones that need it in a single batch"""
+        deleted = [os.path.basename(path) for path in delete_files(
+            [os.path.join(self.backgrounds_path, filename) for filename in filenames], self.privileged_helper
+        )]
+        
+        for filename in deleted:
+            self.remove_image_from_grid(filename)
+        if len(filenames) == 1 and deleted:
+            self.status_label.set_text(f'Imagen eliminada: {deleted[0]}')
+        else:
+            self.status_label.set_text(f'Imágenes eliminadas: {len(deleted)}')
+        if len(deleted) < len(filenames):
+            self.show_error_dialog(f'No se pudieron eliminar {len(filenames) - len(deleted)} imágenes.')
+        
+    def add_image_to_grid(self, filename, is_current=False):
+        """Añadir una imagen al grid"""
+        image_path = os.path.join(self.backgrounds_path, filename)
+        
+        # Main container
+        main_container = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        self.set_tile_size(main_container)
+        
+        # Setup hover effect
+        self.setup_hover_effect(main_container)
+            
+        # Guardar filename y estado como data; los widgets hijos se crean en populate_tile
+        main_container.filename = filename
+        main_container.is_current = is_current
+        main_container.populated = False
+        main_container.image = None
+        main_container.delete_button = None
+        main_container.current_label = None
+        main_container.thumbnail_future = None
+        main_container.thumbnail_size = None
+        try:
+            main_container.mtime = os.stat(image_path).st_mtime_ns
+        except OSError:
+            main_container.mtime = None
+            
+        self.tiles[filename] = main_container
+        self.set_tile_current(main_container, is_current)
+        
+        self.flow_box.add(main_container)
+        main_container.get_parent().show()
+        main_container.show()
+        
+        # En modo diferido solo se construyen los tiles cercanos a la parte visible
+        if self.settings['lazy_grid']:
+            self.schedule_visible_tiles_update()
+        else:
+            self.populate_tile(main_container)
+        return main_container
+        
+    def populate_tile(self, tile):
+        """Create the widgets of a tile and request its thumbnail"""
+        if tile.populated:
+            return
+            
+        filename = tile.filename
+        
+        # Image container with overlay for delete button
+        image_overlay = Gtk.Overlay()
+        
+        # Imagen: se muestra un icono hasta que la miniatura se decodifica en segundo plano
+        image = Gtk.Image.new_from_icon_name('image-x-generic', Gtk.IconSize.DIALOG)
+        width, height = self.preview_dimensions()
+        image.set_size_request(width, height)
+        image_overlay.add(image)
+        
+        # Delete button (hidden while this is the current background)
+        delete_button = Gtk.Button()
+        delete_button.set_label('×')
+        delete_button.set_tooltip_text(f'Eliminar {filename}')
+        delete_button.set_size_request(24, 24)
+        delete_button.get_style_context().add_class('delete-button')
+        delete_button.set_halign(Gtk.Align.END)
+        delete_button.set_valign(Gtk.Align.START)
+        delete_button.set_margin_top(4)
+        delete_button.set_margin_end(4)
+        delete_button.set_no_show_all(True)
+        delete_button.connect('clicked', self.on_delete_image, filename)
+        image_overlay.add_overlay(delete_button)
+        
+        tile.pack_start(image_overlay, False, False, 0)
+        
+        # Label con nombre
+        label = Gtk.Label()
+        label.set_text(filename)
+        label.set_ellipsize(3)  # Pango.EllipsizeMode.END
+        label.set_max_width_chars(20)
+        tile.pack_start(label, False, False, 0)
+        
+        # Indicador de imagen actual
+        current_label = Gtk.Label()
+        current_label.set_markup('<span color="#4CAF50" weight="bold">● Actual</span>')
+        current_label.set_no_show_all(True)
+        tile.pack_start(current_label, False, False, 0)
+        
+        tile.image = image
+        tile.delete_button = delete_button
+        tile.current_label = current_label
+        tile.populated = True
+        self.set_tile_current(tile, tile.is_current)
+        
+        tile.show_all()
+        self.request_thumbnail(tile)
+        
+    def release_tile(self, tile):
+        """Destroy the widgets and pixbuf of a tile that scrolled far away"""
+        if not tile.populated:
+            return
+            
+        if tile.thumbnail_future:
+            tile.thumbnail_future.cancel()
+            tile.thumbnail_future = None
+        for child in tile.get_children():
+            child.destroy()
+            
+        tile.image = None
+        tile.delete_button = None
+        tile.current_label = None
+        tile.thumbnail_size = None
+        tile.populated = False
+        
+    def schedule_visible_tiles_update(self, *args):
+        """Coalesce scroll and resize events into one visibility pass"""
+        if not self.settings['lazy_grid'] or self.visible_update_pending:
+            return
+        self.visible_update_pending = True
+        GLib.idle_add(self.update_visible_tiles)
+        
+    def update_visible_tiles(self):
+        """Populate tiles near the viewport and release the ones far from it"""
+        self.visible_update_pending = False
+        if not self.settings['lazy_grid']:
+            return False
+            
+        adjustment = self.scrolled_window.get_vadjustment()
+        top = adjustment.get_value()
+        page = adjustment.get_page_size()
+        
+        # Se precarga una pantalla por arriba y por abajo; se libera a más de tres
+        near_start, near_end = top - page, top + 2 * page
+        far_start, far_end = top - 3 * page, top + 4 * page
+        
+        for tile in self.tiles.values():
+            allocation = tile.get_parent().get_allocation()
+            if allocation.height <= 1:
+                # Todavía sin asignar tamaño; se revisa en el próximo size-allocate
+                continue
+                
+            tile_top = allocation.y
+            tile_bottom = allocation.y + allocation.height
+            if tile_bottom >= near_start and tile_top <= near_end:
+                self.populate_tile(tile)
+            elif tile_bottom < far_start or tile_top > far_end:
+                self.release_tile(tile)
+        return False
+        
+    def set_lazy_grid(self, enabled):
+        """Switch between lazy and fully realized grid tiles"""
+        self.settings['lazy_grid'] = enabled
+        if enabled:
+            self.schedule_visible_tiles_update()
+        else:
+            for tile in self.tiles.values():
+                self.populate_tile(tile)
+                
+    def remove_image_from_grid(self, filename):
+        """Quitar una sola imagen del grid"""
+        tile = self.tiles.pop(filename, None)
+        if tile is None:
+            return
+            
+        if tile.thumbnail_future:
+            tile.thumbnail_future.cancel()
+        if self.current_background == filename:
+            self.current_background = None
+        self.flow_box.remove(tile.get_parent())
+        
+    def refresh_image_in_grid(self, filename):
+        """Add a new image or re-decode the thumbnail of one that was replaced"""
+        tile = self.tiles.get(filename)
+        if tile is None:
+            self.add_image_to_grid(filename, filename == self.current_background)
+            return
+            
+        try:
+            tile.mtime = os.stat(os.path.join(self.backgrounds_path, filename)).st_mtime_ns
+        except OSError:
+            tile.mtime = None
+        # Los tiles no construidos cargarán la miniatura nueva al hacerse visibles
+        if tile.populated:
+            self.request_thumbnail(tile)
+        
+    def set_current_in_grid(self, filename):
+        """Move the "● Actual" marker, touching only the old and new current tiles"""
+        previous = self.current_background
+        if previous == filename:
+            return
+            
+        if previous in self.tiles:
+            self.set_tile_current(self.tiles[previous], False)
+        if filename in self.tiles:
+            self.set_tile_current(self.tiles[filename], True)
+        self.current_background = filename
+        
+    def set_tile_current(self, tile, is_current):
+        """Toggle the current-background decorations of a tile"""
+        tile.is_current = is_current
+        if tile.populated:
+            tile.current_label.set_visible(is_current)
+            # No se permite eliminar el fondo actual
+            tile.delete_button.set_visible(not is_current)
+        style_context = tile.get_style_context()
+        if is_current:
+            style_context.add_class('current')
+        else:
+            style_context.remove_class('current')
+            
+    def preview_dimensions(self):
+        """Logical size of the grid thumbnails from the preview_size setting"""
+        width = self.settings['preview_size']
+        return width, width * 9 // 16
+        
+    def set_tile_size(self, tile):
+        """Size a tile around the configured preview size"""
+        width, height = self.preview_dimensions()
+        tile.set_size_request(width + 20, height + 70)
+        
+    def request_thumbnail(self, tile):
+        """Decode a thumbnail in the worker pool and hand it to the tile on the main loop"""
+        if tile.thumbnail_future:
+            tile.thumbnail_future.cancel()
+            
+        # En pantallas HiDPI se decodifica a resolución de dispositivo
+        scale = self.get_scale_factor()
+        width, height = self.preview_dimensions()
+        tile.thumbnail_size = (width, height, scale)
+        
+        image_path = os.path.join(self.backgrounds_path, tile.filename)
+        future = self.thumbnail_executor.submit(
+            self.thumbnail_cache.load_pixbuf, image_path, width * scale, height * scale
+        )
+        tile.thumbnail_future = future
+        future.add_done_callback(
+            lambda f: GLib.idle_add(self.on_thumbnail_ready, f, tile, scale)
+        )
+        
+    def apply_preview_size(self, *args):
+        """Resize the tiles and reload thumbnails whose preview size or scale factor changed"""
+        width, height = self.preview_dimensions()
+        size = (width, height, self.get_scale_factor())
+        for tile in self.tiles.values():
+            self.set_tile_size(tile)
+            if not tile.populated or tile.thumbnail_size == size:
+                continue
+            tile.image.set_size_request(width, height)
+            # Los niveles ya guardados en la caché se reescalan sin leer los originales
+            self.request_thumbnail(tile)
+        
+    def on_thumbnail_ready(self, future, tile, scale=1):
+        """Set a decoded thumbnail on its tile (runs on the GTK main thread)"""
+        # Ignorar resultados de tiles eliminados o de peticiones ya reemplazadas
+        if future.cancelled() or tile.thumbnail_future is not future:
+            return False
+        if self.tiles.get(tile.filename) is not tile or not tile.populated:
+            return False
+            
+        tile.thumbnail_future = None
+        try:
+            pixbuf = future.result()
+            if scale > 1:
+                # Una superficie con escala se dibuja a tamaño lógico sin perder nitidez
+                surface = Gdk.cairo_surface_create_from_pixbuf(pixbuf, scale, self.get_window())
+                tile.image.set_from_surface(surface)
+            else:
+                tile.image.set_from_pixbuf(pixbuf)
+        except Exception as e:
+            # Si no se puede cargar la imagen, se mantiene el icono
+            print(f"Debug - Could not load thumbnail: {e}")
+        return False
+        
+    def cancel_pending_thumbnails(self):
+        """Cancel queued decodes for every tile, marking them as still lacking a thumbnail"""
+        for tile in self.tiles.values():
+            if tile.thumbnail_future:
+                tile.thumbnail_future.cancel()
+                tile.thumbnail_future = None
+                tile.thumbnail_size = None
+                
+    def on_window_destroyed(self, widget):
+        """Stop the thumbnail and palette workers when the window is closed"""
+        self.cancel_pending_thumbnails()
+        self.thumbnail_executor.shutdown(wait=False)
+        self.palette_request_id += 1
+        self.palette_executor.shutdown(wait=False, cancel_futures=True)
+        self.precompute_cancel.set()
+        self.privileged_helper.close()
+        self.cancel_file_monitors()
+        
+    def setup_hover_effect(self, container):
+        """Setup hover effect for image containers"""
+        # Add CSS class for styling
+        container.get_style_context().add_class('image-container')
+        
+        # Connect mouse events
+        container.add_events(Gdk.EventMask.ENTER_NOTIFY_MASK | 
+                           Gdk.EventMask.LEAVE_NOTIFY_MASK)
+        container.connect('enter-notify-event', self.on_image_enter)
+        container.connect('leave-notify-event', self.on_image_leave)
+        
+    def on_image_enter(self, widget, event):
+        """Handle mouse enter on image"""
+        # The hover effect is handled by CSS, but we can add additional logic here if needed
+        return False
+        
+    def on_image_leave(self, widget, event):
+        """Handle mouse leave on image"""
+        # The hover effect is handled by CSS, but we can add additional logic here if needed
+        return False
+        
+    def on_delete_image(self, button, filename):
+        """Handle image deletion"""
+        # Confirm deletion
+        dialog = Gtk.MessageDialog(
+            transient_for=self,
+            modal=True,
+            message_type=Gtk.MessageType.WARNING,
+            buttons=Gtk.ButtonsType.YES_NO,
+            text=f'¿Estás seguro de que quieres eliminar "{filename}"?'
+        )
+        dialog.format_secondary_text('Esta acción no se puede deshacer.')
+        
+        response = dialog.run()
+        dialog.destroy()
+        
+        if response == Gtk.ResponseType.YES:
+            self.delete_background_image(filename)
+            
+    def delete_background_image(self, filename):
+        """Delete a background image"""
+        try:
+            # Check if this is the current background
+            current_bg = self.get_current_background()
+            if filename == current_bg:
+                self.show_error_dialog('No puedes eliminar el fondo de pantalla actual.\nPrimero cambia a otro fondo.')
+                return
+                
+            # Mismo camino que el borrado múltiple (con el ayudante si faltan permisos)
+            self.delete_background_images([filename])
+        except Exception as e:
+            self.show_error_dialog(f'Error al eliminar imagen: {str(e)}')
+            
+    def get_current_background(self):
+        """Obtener el fondo actual del archivo de configuración"""
+        try:
+            return self.theme_config.get_background()
+        except Exception as e:
+            print(f'Error al leer configuración: {e}')
+            
+        return None
+        
+    def on_image_selected(self, flow_box, child):
+        """Manejar selección de imagen"""
+        container = child.get_child()
+        filename = getattr(container, 'filename', None)
+        
+        if filename:
+            self.change_background(filename)
+            
+    def change_background(self, filename):
+        """Cambiar el fondo en el archivo de configuración"""
+        try:
+            # Extraer colores en segundo plano; el tema se aplica cuando termine
+            self.request_theme_for_image(filename)
+            
+            if self.all_themes_check.get_active():
+                # Todos los temas en un único lote (una sola autenticación)
+                updated = set_background_for_themes(
+                    self.themes, os.path.join(self.backgrounds_path, filename),
+                    self.settings['config_backups'], self.privileged_helper
+                )
+                self.theme_config.invalidate()
+                written = any(theme.path == self.theme_path for theme in updated)
+                target = f'en {len(updated)} de {len(self.themes)} temas'
+            else:
+                written = self.write_theme_config(self.theme_config.render_background(filename))
+                target = f'en {os.path.basename(self.theme_path)}'
+                
+            if written:
+                self.status_label.set_text(f'Fondo cambiado a: {filename}')
+                
+                # Mover el indicador de fondo actual (solo cambian dos tiles)
+                self.set_current_in_grid(filename)
+                
+                # Mostrar diálogo de confirmación
+                self.show_success_dialog(f'El fondo se ha cambiado a "{filename}" {target}.\nEl tema de la aplicación se ha adaptado automáticamente.\nReinicia SDDM para ver los cambios.')
+            else:
+                self.show_error_dialog('Error de permisos. No se pudo escribir el archivo de configuración.')
+                
+        except Exception as e:
+            self.show_error_dialog(f'Error al cambiar fondo: {str(e)}')
+            print(f'Debug - Error details: {e}')
+            
+    def request_theme_for_image(self, filename):
+        """Extract the palette of an image in a worker thread and apply it on the main loop"""
+        # Las peticiones anteriores quedan obsoletas
+        self.palette_request_id += 1
+        request_id = self.palette_request_id
+        if self.palette_future:
+            self.palette_future.cancel()
+            self.palette_future = None
+            
+        image_path = os.path.join(self.backgrounds_path, filename)
+        if not os.path.exists(image_path):
+            return
+            
+        app = self.get_application()
+        future = self.palette_executor.submit(app.extract_colors_from_image, image_path)
+        self.palette_future = future
+        future.add_done_callback(
+            lambda f: GLib.idle_add(self.on_palette_ready, f, request_id, filename)
+        )
+        
+    def on_palette_ready(self, future, request_id, filename):
+        """Apply an extracted palette unless a newer image was selected meanwhile"""
+        if future.cancelled() or request_id != self.palette_request_id:
+            return False
+            
+        self.palette_future = None
+        try:
+            colors = future.result()
+        except Exception as e:
+            print(f"Error extracting colors: {e}")
+            return False
+            
+        app = self.get_application()
+        app.apply_dynamic_theme(colors)
+        print(f"Debug - Applied dynamic theme from {filename}: {colors}")
+        
+        # Paleta con la que pintará el próximo arranque
+        if app.applied_theme_colors != self.settings.get('last_palette'):
+            self.settings['last_palette'] = dict(app.applied_theme_colors)
+            self.save_app_settings()
+        return False
+        
+    def write_theme_config(self, content):
+        """Write theme1.conf atomically with rotating backups, falling back to pkexec; the only config write path"""
+        written = write_config_file(self.config_path, content, self.settings['config_backups'], self.privileged_helper)
+        self.theme_config.invalidate()
+        return written
+        
+    def on_add_image_clicked(self, button):
+        """Abrir diálogo para añadir nueva imagen"""
+        dialog = Gtk.FileChooserDialog(
+            title='Seleccionar imágenes',
+            parent=self,
+            action=Gtk.FileChooserAction.OPEN
+        )
+        dialog.set_select_multiple(True)
+        
+        dialog.add_button('Cancelar', Gtk.ResponseType.CANCEL)
+        dialog.add_button('Añadir', Gtk.ResponseType.OK)
+        
+        # Filtro para imágenes
+        filter_images = Gtk.FileFilter()
+        filter_images.set_name('Imágenes')
+        filter_images.add_mime_type('image/png')
+        filter_images.add_mime_type('image/jpeg')
+        filter_images.add_mime_type('image/jpg')
+        filter_images.add_mime_type('image/webp')
+        dialog.add_filter(filter_images)
+        
+        response = dialog.run()
+        source_paths = dialog.get_filenames() if response == Gtk.ResponseType.OK else []
+        dialog.destroy()
+        
+        if source_paths:
+            self.import_images(source_paths)
+            
+    def on_import_folder_clicked(self, button):
+        """Importar todas las imágenes de una carpeta"""
+        dialog = Gtk.FileChooserDialog(
+            title='Seleccionar carpeta de imágenes',
+            parent=self,
+            action=Gtk.FileChooserAction.SELECT_FOLDER
+        )
+        
+        dialog.add_button('Cancelar', Gtk.ResponseType.CANCEL)
+        dialog.add_button('Importar', Gtk.ResponseType.OK)
+        
+        response = dialog.run()
+        folder = dialog.get_filename() if response == Gtk.ResponseType.OK else None
+        dialog.destroy()
+        
+        if folder:
+            self.import_images([folder])
+            
+    def on_precompute_clicked(self, button):
+        """Compute the palettes of every background in a process pool"""
+        try:
+            image_paths = [os.path.join(self.backgrounds_path, name)
+                           for name in list_background_images(self.backgrounds_path)]
+        except Exception as e:
+            self.show_error_dialog(f'Error al cargar imágenes: {str(e)}')
+            return
+            
+        app = self.get_application()
+        self.precompute_button.set_sensitive(False)
+        self.status_label.set_text(f'Precalculando colores de {len(image_paths)} imágenes...')
+        
+        def report_progress(done, total, path):
+            GLib.idle_add(self.status_label.set_text,
+                          f'Precalculando colores: {done}/{total} - {os.path.basename(path)}')
+            
+        def run():
+            try:
+                computed, failed = precompute_palettes(
+                    image_paths, app.palette_index, app.palette_backend,
+                    progress_callback=report_progress, cancel_event=self.precompute_cancel
+                )
+                message = f'Colores precalculados: {computed} nuevas, {len(image_paths) - computed - failed} ya en caché'
+                if failed:
+                    message += f', {failed} con errores'
+            except Exception as e:
+                message = f'Error al precalcular colores: {str(e)}'
+            GLib.idle_add(self.on_precompute_finished, message)
+            
+        threading.Thread(target=run, daemon=True).start()
+        
+    def on_precompute_finished(self, message):
+        """Restore the UI after a palette precomputation run"""
+        self.precompute_button.set_sensitive(True)
+        self.status_label.set_text(message)
+        return False
+        
+    def on_refresh_clicked(self, button):
+        """Actualizar lista de imágenes"""
+        self.load_backgrounds()
+        
+    def show_error_dialog(self, message):
+        """Mostrar diálogo de error"""
+        dialog = Gtk.MessageDialog(
+            transient_for=self,
+            modal=True,
+            message_type=Gtk.MessageType.ERROR,
+            buttons=Gtk.ButtonsType.OK,
+            text=message
+        )
+        dialog.set_title('Error')
+        dialog.run()
+        dialog.destroy()
+        
+    def show_success_dialog(self, message):
+        """Mostrar diálogo de éxito"""
+        dialog = Gtk.MessageDialog(
+            transient_for=self,
+            modal=True,
+            message_type=Gtk.MessageType.INFO,
+            buttons=Gtk.ButtonsType.OK,
+            text=message
+        )
+        dialog.set_title('Éxito')
+        dialog.run()
+        dialog.destroy()
+        
+    def on_settings_clicked(self, button):
+        """Show settings dialog"""
+        dialog = SettingsDialog(self)
+        response = dialog.run()
+        
+        if response == Gtk.ResponseType.OK:
+            # Apply settings
+            theme_changed = dialog.apply_settings()
+            # Las columnas se aplican directamente; otro tema cambia de grid
+            if theme_changed:
+                self.switch_theme(self.settings['last_used_theme'])
+            self.save_app_settings()
+            
+        dialog.destroy()
+        
+    def on_about_clicked(self, button):
+        """Show about dialog"""
+        about = Gtk.AboutDialog()
+        about.set_transient_for(self)
+        about.set_modal(True)
+        about.set_program_name('SDDM Background Changer')
+        about.set_version('2.0.0')
+        about.set_comments('Una aplicación moderna para cambiar el fondo de SDDM')
+        about.set_website('https://github.com/rhythmcreative/bg-sddm')
+        about.set_website_label('GitHub')
+        about.set_authors(['RhythmCreative'])
+        about.set_copyright('Copyright © 2024 RhythmCreative')
+        about.set_license_type(Gtk.License.MIT_X11)
+        
+        # Set icon (if available)
+        try:
+            about.set_logo_icon_name('preferences-desktop-wallpaper')
+        except:
+            pass
+        
+        about.run()
+        about.destroy()
+        
+    def on_destroy(self, widget):
+        """Handle window close"""
+        self.save_app_settings()
+        Gtk.main_quit()
+
+class SettingsDialog(Gtk.Dialog):
+    def __init__(self, parent):
+        super().__init__(title='Configuración', parent=parent, modal=True)
+        self.set_default_size(400, 300)
+        self.set_resizable(False)
+        
+        self.parent = parent
+        
+        # Add buttons
+        self.add_button('Cancelar', Gtk.ResponseType.CANCEL)
+        self.add_button('Aplicar', Gtk.ResponseType.OK)
+        
+        # Content area
+        content = self.get_content_area()
+        content.set_spacing(12)
+        content.set_margin_top(12)
+        content.set_margin_bottom(12)
+        content.set_margin_start(12)
+        content.set_margin_end(12)
+        
+        # Grid columns setting
+        grid_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        grid_label = Gtk.Label('Columnas en la cuadrícula:')
+        grid_label.set_halign(Gtk.Align.START)
+        
+        self.grid_spin = Gtk.SpinButton()
+        self.grid_spin.set_range(2, 8)
+        self.grid_spin.set_increments(1, 1)
+        self.grid_spin.set_value(parent.settings.get('grid_columns', 4))
+        
+        grid_box.pack_start(grid_label, False, False, 0)
+        grid_box.pack_end(self.grid_spin, False, False, 0)
+        content.pack_start(grid_box, False, False, 0)
+        
+        # Preview size setting
+        size_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        size_label = Gtk.Label('Tamaño de vista previa:')
+        size_label.set_halign(Gtk.Align.START)
+        
+        self.size_spin = Gtk.SpinButton()
+        self.size_spin.set_range(80, 300)
+        self.size_spin.set_increments(10, 20)
+        self.size_spin.set_value(parent.settings.get('preview_size', 160))
+        
+        size_box.pack_start(size_label, False, False, 0)
+        size_box.pack_end(self.size_spin, False, False, 0)
+        content.pack_start(size_box, False, False, 0)
+        
+        # Lazy grid setting
+        self.lazy_check = Gtk.CheckButton(label='Cargar miniaturas solo al hacerse visibles')
+        self.lazy_check.set_tooltip_text('Reduce el uso de memoria con bibliotecas muy grandes')
+        self.lazy_check.set_active(parent.settings.get('lazy_grid', True))
+        content.pack_start(self.lazy_check, False, False, 0)
+        
+        # Palette backend setting
+        backend_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        backend_label = Gtk.Label('Extracción de colores:')
+        backend_label.set_halign(Gtk.Align.START)
+        
+        self.backend_combo = Gtk.ComboBoxText()
+        for backend in PALETTE_BACKENDS:
+            self.backend_combo.append(backend, backend)
+        self.backend_combo.set_active_id(parent.get_application().palette_backend)
+        
+        backend_box.pack_start(backend_label, False, False, 0)
+        backend_box.pack_end(self.backend_combo, False, False, 0)
+        content.pack_start(backend_box, False, False, 0)
+        
+        # Import normalization settings
+        self.normalize_check = Gtk.CheckButton(label='Optimizar imágenes al importar (resolución del monitor)')
+        self.normalize_check.set_active(parent.settings.get('normalize_on_import', False))
+        content.pack_start(self.normalize_check, False, False, 0)
+        
+        normalize_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        self.format_combo = Gtk.ComboBoxText()
+        self.format_combo.append('jpeg', 'JPEG progresivo')
+        self.format_combo.append('webp', 'WebP')
+        self.format_combo.set_active_id(parent.settings.get('normalize_format', 'jpeg'))
+        
+        self.quality_spin = Gtk.SpinButton()
+        self.quality_spin.set_range(50, 100)
+        self.quality_spin.set_increments(1, 5)
+        self.quality_spin.set_value(parent.settings.get('normalize_quality', 90))
+        
+        self.keep_originals_check = Gtk.CheckButton(label='Conservar originales')
+        self.keep_originals_check.set_active(parent.settings.get('keep_originals', True))
+        
+        normalize_box.pack_start(self.format_combo, False, False, 0)
+        normalize_box.pack_start(Gtk.Label('Calidad:'), False, False, 0)
+        normalize_box.pack_start(self.quality_spin, False, False, 0)
+        normalize_box.pack_end(self.keep_originals_check, False, False, 0)
+        content.pack_start(normalize_box, False, False, 0)
+        
+        # Duplicate policy setting
+        duplicate_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        duplicate_label = Gtk.Label('Duplicados al importar:')
+        duplicate_label.set_halign(Gtk.Align.START)
+        
+        self.duplicate_combo = Gtk.ComboBoxText()
+        duplicate_labels = {'skip': 'Omitir', 'flag': 'Importar y avisar', 'allow': 'Permitir'}
+        for policy in DUPLICATE_POLICIES:
+            self.duplicate_combo.append(policy, duplicate_labels[policy])
+        self.duplicate_combo.set_active_id(parent.settings.get('duplicate_policy', 'skip'))
+        
+        duplicate_box.pack_start(duplicate_label, False, False, 0)
+        duplicate_box.pack_end(self.duplicate_combo, False, False, 0)
+        content.pack_start(duplicate_box, False, False, 0)
+        
+        # Theme path setting
+        theme_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        theme_label = Gtk.Label('Ruta del tema SDDM:')
+        theme_label.set_halign(Gtk.Align.START)
+        
+        self.theme_entry = Gtk.Entry()
+        self.theme_entry.set_text(parent.theme_path)
+        
+        theme_button = Gtk.Button('Seleccionar...')
+        theme_button.connect('clicked', self.on_select_theme_path)
+        
+        theme_path_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        theme_path_box.pack_start(self.theme_entry, True, True, 0)
+        theme_path_box.pack_start(theme_button, False, False, 0)
+        
+        theme_box.pack_start(theme_label, False, False, 0)
+        theme_box.pack_start(theme_path_box, False, False, 0)
+        content.pack_start(theme_box, False, False, 0)
+        
+        self.show_all()
+        
+    def on_select_theme_path(self, button):
+        """Select theme path"""
+        dialog = Gtk.FileChooserDialog(
+            title='Seleccionar directorio del tema',
+            parent=self,
+            action=Gtk.FileChooserAction.SELECT_FOLDER
+        )
+        
+        dialog.add_button('Cancelar', Gtk.ResponseType.CANCEL)
+        dialog.add_button('Seleccionar', Gtk.ResponseType.OK)
+        
+        response = dialog.run()
+        if response == Gtk.ResponseType.OK:
+            path = dialog.get_filename()
+            if path:
+                self.theme_entry.set_text(path)
+                
+        dialog.destroy()
+        
+    def apply_settings(self):
+        """Apply the settings"""
+        self.parent.settings['grid_columns'] = int(self.grid_spin.get_value())
+        self.parent.settings['preview_size'] = int(self.size_spin.get_value())
+        
+        self.parent.settings['normalize_on_import'] = self.normalize_check.get_active()
+        self.parent.settings['normalize_format'] = self.format_combo.get_active_id() or 'jpeg'
+        self.parent.settings['normalize_quality'] = int(self.quality_spin.get_value())
+        self.parent.settings['keep_originals'] = self.keep_originals_check.get_active()
+        self.parent.settings['duplicate_policy'] = self.duplicate_combo.get_active_id() or 'skip'
+        
+        backend = self.backend_combo.get_active_id()
+        if backend:
+            self.parent.settings['palette_backend'] = backend
+            self.parent.get_application().set_palette_backend(backend)
+        
+        lazy_grid = self.lazy_check.get_active()
+        if lazy_grid != self.parent.settings['lazy_grid']:
+            self.parent.set_lazy_grid(lazy_grid)
+        
+        # Update theme path if changed
+        new_theme_path = os.path.normpath(self.theme_entry.get_text())
+        theme_changed = new_theme_path != self.parent.theme_path
+        if theme_changed:
+            self.parent.settings['last_used_theme'] = new_theme_path
+        
+        # Update flow box
+        self.parent.flow_box.set_max_children_per_line(self.parent.settings['grid_columns'])
+        self.parent.apply_preview_size()
+        return theme_changed
@@ -65,6 +65,15 @@ else
     echo "✓ Todas las dependencias de Python encontradas"
 fi
 
+# Instalar el ayudante con permisos y su acción de polkit
+echo "Instalando el ayudante de permisos (pkexec)..."
+if sudo install -Dm755 bg-sddm-helper /usr/lib/bg-sddm/bg-sddm-helper && \
+   sudo install -Dm644 org.bg-sddm.helper.policy /usr/share/polkit-1/actions/org.bg-sddm.helper.policy; then
+    echo "✓ Ayudante instalado en /usr/lib/bg-sddm/bg-sddm-helper"
+else
+    echo "⚠️  Error instalando el ayudante; los cambios en /usr/share/sddm/themes fallarán"
+fi
+
 # Hacer ejecutable el archivo .desktop
 chmod +x ~/.local/share/applications/bg-sddm.desktop
 echo "✓ Archivo .desktop hecho ejecutable"
@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bg_sddm import ContentIndex
+
+
+class ContentIndexRefreshTest(unittest.TestCase):
+    """refresh works whether or not the index was loaded before"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, 'Backgrounds')
+        os.mkdir(self.directory)
+        self.index = ContentIndex(os.path.join(self.tmp.name, 'content_index.json'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_empty_directory_before_load(self):
+        self.assertEqual(self.index.refresh(self.directory, use_phash=False), {})
+
+    def test_forgets_removed_files(self):
+        path = os.path.join(self.directory, 'a.jpg')
+        with open(path, 'wb') as f:
+            f.write(b'not really a jpeg')
+        self.assertEqual(list(self.index.refresh(self.directory, use_phash=False)), [path])
+
+        os.remove(path)
+        self.assertEqual(self.index.refresh(self.directory, use_phash=False), {})
+        self.assertNotIn(path, self.index.entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
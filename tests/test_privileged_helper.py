@@ -0,0 +1,123 @@
+import importlib.machinery
+import importlib.util
+import os
+import tempfile
+import unittest
+
+HELPER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bg-sddm-helper')
+
+
+def load_helper():
+    """Import the bg-sddm-helper script, which has no .py extension"""
+    loader = importlib.machinery.SourceFileLoader('bg_sddm_helper', HELPER)
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+class HelperAllowlistTest(unittest.TestCase):
+    """The helper only touches theme folders and each theme's own config file"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.realpath(self.tmp.name)
+        self.themes = os.path.join(self.root, 'themes')
+        self.helper = load_helper()
+        self.helper.THEMES_DIR = self.themes
+
+        # Tema con Themes/theme1.conf (astronaut)
+        self.astronaut = os.path.join(self.themes, 'astronaut')
+        os.makedirs(os.path.join(self.astronaut, 'Themes'))
+        os.makedirs(os.path.join(self.astronaut, 'Backgrounds'))
+        self.write(os.path.join(self.astronaut, 'Themes', 'theme1.conf'), 'Background=a.jpg\n')
+
+        # Tema con theme.conf en la raíz, indicado por metadata.desktop (breeze)
+        self.breeze = os.path.join(self.themes, 'breeze')
+        os.makedirs(self.breeze)
+        self.write(os.path.join(self.breeze, 'metadata.desktop'), '[SddmGreeterTheme]\nConfigFile=theme.conf\n')
+        self.write(os.path.join(self.breeze, 'theme.conf'), '[General]\nbackground=a.jpg\n')
+        self.write(os.path.join(self.breeze, 'Main.qml'), 'Item {}\n')
+
+        self.outside = os.path.join(self.root, 'outside.conf')
+        self.write(self.outside, 'secret\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @staticmethod
+    def write(path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_theme_folders(self):
+        path = os.path.join(self.astronaut, 'Backgrounds', 'new.jpg')
+        self.assertEqual(self.helper.theme_path(path), path)
+        config = os.path.join(self.astronaut, 'Themes', 'theme1.conf')
+        self.assertEqual(self.helper.theme_path(config), config)
+        self.assertEqual(self.helper.theme_path(config + '.backup-20261018-120000'), config + '.backup-20261018-120000')
+
+        folder = os.path.join(self.breeze, 'Backgrounds')
+        self.assertIsNone(self.helper.theme_path(folder))
+        self.assertEqual(self.helper.theme_path(folder, folder=True), folder)
+
+    def test_root_config_file(self):
+        config = os.path.join(self.breeze, 'theme.conf')
+        for path in (config, config + '.user', config + '.backup-20261018-120000'):
+            self.assertEqual(self.helper.theme_path(path), path)
+
+        # El resto de la raíz del tema no se puede tocar
+        for name in ('Main.qml', 'metadata.desktop', 'theme.conf.other'):
+            self.assertIsNone(self.helper.theme_path(os.path.join(self.breeze, name)))
+        self.assertIsNone(self.helper.theme_path(config, folder=True))
+        # Ni el theme.conf de un tema cuya configuración está en Themes/
+        self.assertIsNone(self.helper.theme_path(os.path.join(self.astronaut, 'theme.conf')))
+
+    def test_rejects_escapes(self):
+        for path in (os.path.join(self.astronaut, 'Backgrounds', '..', '..', '..', 'outside.conf'),
+                     os.path.join(self.themes, '..', 'outside.conf'),
+                     os.path.join(self.themes, 'theme.conf'),
+                     'Backgrounds/relative.jpg',
+                     None):
+            self.assertIsNone(self.helper.theme_path(path), path)
+
+    def test_rejects_symlinks_out_of_the_theme(self):
+        link = os.path.join(self.astronaut, 'Backgrounds', 'link.jpg')
+        os.symlink(self.outside, link)
+        self.assertIsNone(self.helper.theme_path(link))
+
+        # Un theme.conf enlazado fuera del tema tampoco es su configuración
+        os.remove(os.path.join(self.breeze, 'theme.conf'))
+        os.symlink(self.outside, os.path.join(self.breeze, 'theme.conf'))
+        self.assertIsNone(self.helper.theme_path(os.path.join(self.breeze, 'theme.conf')))
+
+    def test_config_file_outside_the_theme(self):
+        self.write(os.path.join(self.breeze, 'metadata.desktop'), 'ConfigFile=../../outside.conf\n')
+        self.assertIsNone(self.helper.theme_path(self.outside))
+        self.assertIsNone(self.helper.theme_path(os.path.join(self.breeze, 'theme.conf')))
+
+    def test_run_operation(self):
+        config = os.path.join(self.breeze, 'theme.conf')
+        self.helper.run_operation(['copy', config, config + '.backup-20261018-120000'])
+        self.helper.run_operation(['write', config, '[General]\nbackground=b.jpg\n'])
+        with open(config) as f:
+            self.assertEqual(f.read(), '[General]\nbackground=b.jpg\n')
+        with open(config + '.backup-20261018-120000') as f:
+            self.assertEqual(f.read(), '[General]\nbackground=a.jpg\n')
+
+        self.helper.run_operation(['mkdir', os.path.join(self.breeze, 'Backgrounds')])
+        self.assertTrue(os.path.isdir(os.path.join(self.breeze, 'Backgrounds')))
+
+        with self.assertRaises(PermissionError):
+            self.helper.run_operation(['write', os.path.join(self.breeze, 'Main.qml'), 'x'])
+        with self.assertRaises(PermissionError):
+            self.helper.run_operation(['delete', self.outside])
+        with self.assertRaises(PermissionError):
+            self.helper.run_operation(['mkdir', os.path.join(self.breeze, 'Other')])
+        with self.assertRaises(ValueError):
+            self.helper.run_operation(['chmod', config])
+        self.assertTrue(os.path.exists(self.outside))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bg_sddm import active_rotation_bucket, pick_next_background, rotation_period_key
+
+
+class ShuffleRotationTest(unittest.TestCase):
+    """The shuffle policy shows every image once per round"""
+
+    def test_no_repeat_within_a_round(self):
+        names = ['a.jpg', 'b.jpg', 'c.jpg', 'd.jpg']
+        for _ in range(200):
+            state = {}
+            current = 'd.jpg'
+            picks = []
+            for _ in range(10 * len(names)):
+                choice = pick_next_background(names, current, 'shuffle', state)
+                self.assertNotEqual(choice, current)
+                picks.append(choice)
+                current = choice
+
+            for start in range(0, len(picks), len(names)):
+                self.assertEqual(sorted(picks[start:start + len(names)]), names)
+
+    def test_single_image(self):
+        state = {}
+        self.assertEqual(pick_next_background(['a.jpg'], 'a.jpg', 'shuffle', state), 'a.jpg')
+        self.assertIsNone(pick_next_background([], None, 'shuffle', state))
+
+
+class RotationPeriodTest(unittest.TestCase):
+    """Period keys only change when a new period or bucket starts"""
+
+    def test_bucket_across_midnight(self):
+        buckets = {'07:00': ['day-*'], '20:00': ['night-*']}
+        keys = set()
+        for now in (datetime(2026, 10, 18, 20, 30), datetime(2026, 10, 18, 23, 59),
+                    datetime(2026, 10, 19, 0, 1), datetime(2026, 10, 19, 6, 59)):
+            bucket = active_rotation_bucket(buckets, now)
+            self.assertEqual(bucket, '20:00')
+            keys.add(rotation_period_key('bucket', now, bucket))
+        self.assertEqual(keys, {'2026-10-18 20:00'})
+
+        now = datetime(2026, 10, 19, 7, 0)
+        self.assertEqual(rotation_period_key('bucket', now, active_rotation_bucket(buckets, now)), '2026-10-19 07:00')
+
+
+class WeightedRotationTest(unittest.TestCase):
+    """The weighted policy never fails on degenerate weights"""
+
+    def test_all_zero_weights(self):
+        names = ['a.jpg', 'b.jpg', 'c.jpg']
+        weights = {name: 0 for name in names}
+        for _ in range(50):
+            self.assertIn(pick_next_background(names, 'a.jpg', 'weighted', {}, weights), ['b.jpg', 'c.jpg'])
+
+
+if __name__ == '__main__':
+    unittest.main()